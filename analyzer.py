@@ -1,114 +1,221 @@
-import json
+import sys
 from collections import defaultdict
-from operator import itemgetter
-
-from typing import Dict, Any, Optional
-
-from tqdm import tqdm
+from functools import partial
 
+import pipeline
 from groupme import GroupMe
-
-IGNORE = ['the', 'be', 'to', 'of', 'and', 'a', 'in', 'that', 'have', 'I', 'it',
-          'for', 'not', 'on', 'with', 'he', 'as', 'you', 'do', 'at', 'this', 'but',
-          'his', 'by', 'from', 'they', 'we', 'say', 'her', 'she', 'or', 'an', 'will',
-          'my', 'one', 'all', 'would', 'there', 'their', 'what', 'so', 'up', 'out',
-          'if', 'about', 'who', 'get', 'which', 'go', 'me', 'when', 'make', 'can',
-          'like', 'time', 'no', 'just', 'him', 'know', 'take', 'person', 'into',
-          'year', 'your', 'good', 'some', 'could', 'them', 'see', 'other', 'than',
-          'then', 'now', 'look', 'only', 'come', 'its', 'over', 'think', 'also',
-          'back', 'after', 'use', 'two', 'how', 'our', 'work', 'first', 'well', 'way',
-          'even', 'new', 'want', 'because', 'any', 'these', 'give', 'day', 'most',
-          'us', '']
-
-
-def translate_non_alphanumerics(to_translate, translate_to=u'_'):
-    not_letters_or_digits = '!"#%\'()*+,-./:;<=>?@[\\]^_`{|}~'
-    translate_table = dict((ord(char), translate_to)
-                           for char in not_letters_or_digits)
-    return to_translate.translate(translate_table)
-
-
-def rank_in_dict(d: Dict[str, Any], key: str) -> int:
-    # given a dict from uid -> value, find the rank of uid in dict
-    return sorted(d, key=lambda k: d[k], reverse=True).index(key) + 1 if key in d else -1
+from likematrix import LikeMatrix
+from ranking import RankIndex, SpaceSaving, Tally
+from timeline import LIKES_RECEIVED, LIKES_SENT, MESSAGES, Timeline, rank, top
+from tokenizer import tokenize
 
 
 class Analyzer:
     # messages is passed in raw from GroupMe
-    def __init__(self, database: GroupMe):
+    # with word_capacity set, word counts are approximate and at most that many words are kept, globally and per user
+    def __init__(self, database: GroupMe, word_capacity=None):
         self.database = database
-        # MBU: user_id -> [message]
-        self.messages_by_user = defaultdict(list)
-
-        # who has liked {{user}}'s messages?
-        # user_id -> (liker -> count)
-        self.likes_per_user = defaultdict(lambda: defaultdict(int))
+        self.word_capacity = word_capacity
+        # how many messages has {{user}} sent?
+        # user_id -> count
+        self.message_counts = defaultdict(int)
 
-        # who has {{user}} liked?
-        # user_id -> (liked -> count)
-        self.user_likes = defaultdict(lambda: defaultdict(int))
+        # who has liked whose messages? likes sent and received, self-likes and like/message ratios all
+        # come out of this
+        self.likes = LikeMatrix()
 
         # which words are used most often?
-        # word -> (user_id -> count)
-        self.most_common_words = defaultdict(lambda: defaultdict(int))
+        # word -> count, kept in rank order
+        self.word_totals = RankIndex() if word_capacity is None else SpaceSaving(word_capacity)
 
         # per user, which words are used most often?
         # user_id -> (word -> count)
-        self.mcw_per_user = defaultdict(lambda: defaultdict(int))
+        self.mcw_per_user = defaultdict(Tally if word_capacity is None else partial(SpaceSaving, word_capacity))
 
-        # which users have liked their own posts?
-        # user_id -> count
-        self.self_likes = defaultdict(int)
+        # the same counts by day (by month once old), for questions about a stretch of time
+        self.timeline = Timeline(word_capacity)
 
-    def rebuild(self):
-        for message in tqdm(self.database.messages(), desc="Rebuilding analyzer models"):
-            self.read_message(json.loads(message['object']))
+        # bumped by every message read; listeners are called with the new version and the tags of what the
+        # message changed: "messages:<uid>", "received:<uid>", "sent:<uid>", "words:<uid>", "words",
+        # "self_likes", "likes" (any like) and "ranks"
+        self.version = 0
+        self.listeners = []
 
-    def read_message(self, message):
+    def rebuild(self):
+        pipeline.run(self.database, {'analyzer': self})
+
+    def shard_factory(self):
+        # builds an empty copy for a pipeline worker process
+        return partial(Analyzer, None, self.word_capacity)
+
+    def snapshot_config(self):
+        return {'word_capacity': self.word_capacity}
+
+    def to_snapshot(self):
+        # word_totals follows from mcw_per_user, so only that is stored
+        return {
+            'message_counts': dict(self.message_counts),
+            'like_users': self.likes.users,
+            'mcw_per_user': {sender: dict(words.items()) for sender, words in self.mcw_per_user.items()},
+            'timeline': self.timeline.to_snapshot(),
+        }, self.likes.to_arrays()
+
+    def load_snapshot(self, meta, arrays):
+        for sender, count in meta['message_counts'].items():
+            self.message_counts[sender] += count
+            self.likes.count_message(sender, count)
+
+        self.likes.load_arrays(meta['like_users'], arrays)
+
+        for sender, words in meta['mcw_per_user'].items():
+            for word, count in words.items():
+                self.mcw_per_user[sender].add(word, count)
+                self.word_totals.add(word, count)
+
+        self.timeline.load_snapshot(meta['timeline'])
+
+    def size_bytes(self):
+        # rough: the containers and their per-user tables, not the keys they share with other models
+        size = sum(sys.getsizeof(table) for table in (self.message_counts, self.mcw_per_user))
+        size += self.likes.nbytes() + sys.getsizeof(self.likes.ids) + sys.getsizeof(self.likes.users)
+        for words in self.mcw_per_user.values():
+            size += sys.getsizeof(words) if isinstance(words, dict) else 150 * len(words)
+        # a dict entry plus a sorted (value, key) tuple per key
+        size += 150 * len(self.word_totals)
+        for prefixes in self.timeline.series.values():
+            size += sum(sys.getsizeof(sums) for sums in prefixes.values())
+        size += sum(sys.getsizeof(words) if isinstance(words, dict) else 150 * len(words)
+                    for words in self.timeline.words)
+        return size
+
+    def read_message(self, message, tokens=None):
         sender = message["user_id"]
-        self.messages_by_user[sender] += [message]
+        created = message["created_at"]
+        self.message_counts[sender] += 1
+        self.likes.count_message(sender)
+        self.timeline.add(created, MESSAGES, sender)
 
-        text = message["text"]
-        for word in text.split(" "):
-            word = translate_non_alphanumerics(word, translate_to=u"").lower()
-            if word in IGNORE:
-                continue
-            self.most_common_words[word][sender] += 1
-            self.mcw_per_user[sender][word] += 1
+        words = (tokens or tokenize(message["text"])).words
+        for word in words:
+            self.word_totals.add(word, 1)
+            self.mcw_per_user[sender].add(word, 1)
+        self.timeline.add_words(created, words)
 
         for liker in message["favorited_by"]:
-            self.user_likes[liker][sender] += 1
-            self.likes_per_user[sender][liker] += 1
-
-            if liker == sender:
-                self.self_likes[sender] += 1
+            self._like(sender, liker, created, 1)
+
+        self.version += 1
+        if self.listeners:
+            # any message moves its sender's like/message ratio
+            tags = {"messages:" + sender, "ranks"}
+            if words:
+                tags.update(("words", "words:" + sender))
+            if message["favorited_by"]:
+                tags.update(("likes", "received:" + sender))
+                tags.update("sent:" + liker for liker in message["favorited_by"])
+            if sender in message["favorited_by"]:
+                tags.add("self_likes")
+            for listener in self.listeners:
+                listener(self.version, tags)
+
+    def update_likes(self, message, before, tokens=None):
+        # message was read with before as its likers and now has favorited_by instead
+        sender = message["user_id"]
+        added = set(message["favorited_by"]) - set(before)
+        removed = set(before) - set(message["favorited_by"])
+        if not added and not removed:
+            return
+
+        for liker in added:
+            self._like(sender, liker, message["created_at"], 1)
+        for liker in removed:
+            self._like(sender, liker, message["created_at"], -1)
+
+        self.version += 1
+        if self.listeners:
+            tags = {"likes", "received:" + sender, "ranks"}
+            tags.update("sent:" + liker for liker in added | removed)
+            if sender in added | removed:
+                tags.add("self_likes")
+            for listener in self.listeners:
+                listener(self.version, tags)
+
+    def _like(self, sender, liker, created, delta):
+        # counts (or with delta -1, uncounts) one like
+        self.likes.add(liker, sender, delta)
+        self.timeline.add(created, LIKES_SENT, liker, delta)
+        self.timeline.add(created, LIKES_RECEIVED, sender, delta)
+
+    # since is a day number (see timeline.day_of): leaderboards and counts then cover that day onwards,
+    # or the whole month it falls in once that month has been rolled up; counted_since says which
+    def counted_since(self, since):
+        return None if since is None else self.timeline.start(since)
+
+    def get_top_words(self, uid=None, limit=15, since=None):
+        if since is not None:
+            if uid is not None:
+                raise Exception("Word counts over time are only kept for the whole group.")
+            return self.timeline.top_words(since, limit)
+        if uid is None:
+            return self.word_totals.top(limit)
+        return self.mcw_per_user[uid].top(limit) if uid in self.mcw_per_user else []
 
     def get_self_likes(self, limit=15):
-        return [(uid, self.self_likes[uid]) for uid in sorted(
-            self.self_likes, key=self.self_likes.get, reverse=True)[:limit]]
-
-    def get_likes_sent_and_rank(self, uid):
-        likes_sent_per_user: Dict[str, int] = {k: sum(self.user_likes[k].values()) for k in self.user_likes}
-        return likes_sent_per_user[uid], rank_in_dict(likes_sent_per_user, uid)
-
-    def get_most_overall_likes_sent(self, limit=15):
-        likes_sent_per_user: Dict[str, int] = {k: sum(self.user_likes[k].values()) for k in self.user_likes}
-        return sorted(likes_sent_per_user.items(), key=itemgetter(1), reverse=True)[:limit]
-
-    def get_likes_received_and_rank(self, uid):
-        likes_recd_per_user: Dict[str, int] = {k: sum(self.likes_per_user[k].values()) for k in self.likes_per_user}
-        return likes_recd_per_user[uid], rank_in_dict(likes_recd_per_user, uid)
-
-    def get_most_overall_likes_recd(self, limit=15):
-        likes_recd_per_user: Dict[str, int] = {k: sum(self.likes_per_user[k].values()) for k in self.likes_per_user}
-        return sorted(likes_recd_per_user.items(), key=itemgetter(1), reverse=True)[:limit]
-
-    def get_ratio_and_rank(self, uid):
-        ratios_per_user: Dict[str, float] = {
-            k: float(sum(self.likes_per_user[k].values())) / len(self.messages_by_user[k]) for k in self.likes_per_user}
-        return ratios_per_user[uid], rank_in_dict(ratios_per_user, uid)
-
-    def get_highest_overall_ratio(self, limit=15):
-        ratios_per_user: Dict[str, float] = {
-            k: float(sum(self.likes_per_user[k].values())) / len(self.messages_by_user[k]) for k in self.likes_per_user}
-        return sorted(ratios_per_user.items(), key=itemgetter(1), reverse=True)[:limit]
+        return self.likes.top(self.likes.self_likes(), limit)
+
+    def _value_and_rank(self, values, uid):
+        # values by id, from the like matrix
+        i = self.likes.ids.get(uid)
+        return (values[i].item() if i is not None else 0), self.likes.rank(values, uid)
+
+    def get_likes_sent_and_rank(self, uid, since=None):
+        if since is None:
+            return self._value_and_rank(self.likes.sent(), uid)
+        values = self.timeline.totals(LIKES_SENT, since)
+        return values.get(uid, 0), rank(values, uid)
+
+    def get_most_overall_likes_sent(self, limit=15, since=None):
+        if since is None:
+            return self.likes.top(self.likes.sent(), limit)
+        return top(self.timeline.totals(LIKES_SENT, since), limit)
+
+    def get_likes_received_and_rank(self, uid, since=None):
+        if since is None:
+            return self._value_and_rank(self.likes.received(), uid)
+        values = self.timeline.totals(LIKES_RECEIVED, since)
+        return values.get(uid, 0), rank(values, uid)
+
+    def get_most_overall_likes_recd(self, limit=15, since=None):
+        if since is None:
+            return self.likes.top(self.likes.received(), limit)
+        return top(self.timeline.totals(LIKES_RECEIVED, since), limit)
+
+    def get_ratio_and_rank(self, uid, since=None):
+        if since is None:
+            ratio, ratio_rank = self._value_and_rank(self.likes.ratios(), uid)
+            return float(ratio), ratio_rank
+        ratios = self.timeline.ratios(since)
+        return ratios.get(uid, 0.0), rank(ratios, uid)
+
+    def get_highest_overall_ratio(self, limit=15, since=None):
+        if since is None:
+            return self.likes.top(self.likes.ratios(), limit)
+        return top(self.timeline.ratios(since), limit)
+
+    def get_likes_from(self, uid, limit=15):
+        # (likes uid has sent, [(user_id, count)] for who they liked most)
+        liked = self.likes.liked_by(uid)
+        return int(liked.sum()), self.likes.top(liked, limit)
+
+    def get_likes_to(self, uid, limit=15):
+        # (likes uid has received, [(user_id, count)] for who liked them most)
+        likers = self.likes.likers_of(uid)
+        return int(likers.sum()), self.likes.top(likers, limit)
+
+    def get_true_love(self, uid):
+        # (user_id, score) for whoever uid shares the most mutual likes with, or None
+        scores = self.likes.affinity(uid)
+        if not len(scores) or not scores.max():
+            return None
+        best = int(scores.argmax())
+        return self.likes.users[best], scores[best].item()
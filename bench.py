@@ -0,0 +1,183 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+
+import dataset
+
+from analyzer import Analyzer
+from bot import GroupBot
+from fakegroupme import FakeGroupMe, serve
+from gen import Generator
+from groupme import BATCH_SIZE, GroupMe
+from synthetic import SyntheticGroup
+
+# bot commands timed against the rebuilt models; <x> is replaced with a sampled user's name
+COMMANDS = [
+    "/bot rank",
+    "/bot rank <x>",
+    "/bot words",
+    "/bot words for <x>",
+    "/bot likes from <x>",
+    "/bot likes to <x>",
+    "/bot ratio for <x>",
+    "/bot ego",
+    "/bot mimic <x>",
+]
+
+
+def _reset_peak_rss():
+    # resets the process's RSS high-water mark, so the next reading is one operation's peak; only Linux
+    # allows it. False if it couldn't be reset
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+        return True
+    except OSError:
+        return False
+
+
+def _peak_rss_mb():
+    # the high-water mark since the last reset (VmHWM is in kilobytes)
+    with open('/proc/self/status') as f:
+        for line in f:
+            if line.startswith('VmHWM:'):
+                return int(line.split()[1]) / 1024.0
+
+
+def _percentile(latencies, quantile):
+    return latencies[int(quantile * (len(latencies) - 1))] if latencies else None
+
+
+class Recorder:
+    # one JSON object per line per operation, so runs from different releases can be diffed or loaded
+    # straight into a dataframe
+    def __init__(self, out, messages, label):
+        self.out = out
+        self.base = {
+            'label': label,
+            'messages': messages,
+            'python': platform.python_version(),
+        }
+
+    def throughput(self, op, count, fn):
+        # times one run of fn over count items
+        measured = _reset_peak_rss()
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        self._write(op, measured, count=count, seconds=seconds, throughput=count / seconds if seconds else None)
+
+    def latency(self, op, calls):
+        # times each call separately
+        measured = _reset_peak_rss()
+        latencies = []
+        for call in calls:
+            start = time.perf_counter()
+            call()
+            latencies.append(time.perf_counter() - start)
+
+        latencies.sort()
+        seconds = sum(latencies)
+        self._write(op, measured, count=len(latencies), seconds=seconds,
+                    throughput=len(latencies) / seconds if seconds else None,
+                    p50_ms=1000 * _percentile(latencies, 0.5), p99_ms=1000 * _percentile(latencies, 0.99))
+
+    def _write(self, op, measured, **fields):
+        # peak_rss_mb is the operation's own peak, or None where the high-water mark can't be reset
+        record = dict(self.base, op=op, peak_rss_mb=round(_peak_rss_mb(), 1) if measured else None, **fields)
+        self.out.write(json.dumps(record) + "\n")
+        self.out.flush()
+
+
+def run(args, out):
+    group = SyntheticGroup(args.count, users=args.users, seed=args.seed)
+    recorder = Recorder(out, args.count, args.label)
+
+    # with --direct the fake server serves no history, and messages are bulk inserted instead of fetched,
+    # since it would otherwise hold every message in memory
+    app = FakeGroupMe(group.group_id, group.members, [] if args.direct else list(group))
+    server = serve(app)
+    config = {
+        'api_url': 'http://127.0.0.1:{}/v3'.format(server.server_port),
+        'auth_key': 'bench',
+        'group_id': group.group_id,
+        'bot_id': 'bench',
+        # /bot mimic generates on request, rather than timing pool hits while a refill thread competes for the CPU
+        'mimic_pool_size': 0,
+    }
+
+    db = dataset.connect(args.database or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db'))
+    database = GroupMe(db, config)
+    database.recreate_all_names()
+
+    if args.direct:
+        def insert():
+            batch = []
+            for message in group:
+                batch.append(message)
+                if len(batch) == BATCH_SIZE:
+                    database.insert_messages(batch)
+                    batch = []
+            database.insert_messages(batch)
+        recorder.throughput('GroupMe.insert_messages', args.count, insert)
+    else:
+        recorder.throughput('GroupMe.recreate_messages', args.count, database.recreate_messages)
+
+    analyzer = Analyzer(database)
+    recorder.throughput('Analyzer.rebuild', args.count, analyzer.rebuild)
+
+    generator = Generator(args.k, database)
+
+    def rebuild_generator():
+        generator.rebuild()
+        # each index otherwise sorts its suffixes on its first sample, which would land in Generator.generate
+        for index in generator.m.values():
+            index.compact()
+    recorder.throughput('Generator.rebuild', args.count, rebuild_generator)
+
+    # users are sampled by how much they post, like real requests
+    rnd = random.Random(args.seed)
+    uids = [uid for uid, count in analyzer.message_counts.items() for _ in range(count)]
+    sampled = [rnd.choice(uids) for _ in range(args.samples)]
+
+    recorder.latency('Generator.generate', [lambda uid=uid: generator.generate(uid, 30) for uid in sampled])
+
+    bot = GroupBot(config, analyzer, generator, database, send=lambda bot_id, text: None)
+    for command in COMMANDS:
+        def call(uid):
+            message = {'text': command.replace('<x>', database.get_name(uid)), 'user_id': uid, 'favorited_by': []}
+            # every call renders from the models rather than the reply cache
+            bot.cache.clear()
+            return getattr(bot, command.split(" ")[1])(message)
+
+        recorder.latency('BotEngine.' + command, [lambda uid=uid: call(uid) for uid in sampled])
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the bot against a synthetic group.')
+    parser.add_argument('--messages', dest='count', type=int, default=10000, help="Messages in the group.")
+    parser.add_argument('--users', dest='users', type=int, default=50, help="Members in the group.")
+    parser.add_argument('--seed', dest='seed', type=int, default=0, help="Seed for the synthetic group.")
+    parser.add_argument('--k', dest='k', type=int, default=7, help="Generator window size.")
+    parser.add_argument('--samples', dest='samples', type=int, default=200,
+                        help="Calls per operation for latency percentiles.")
+    parser.add_argument('--direct', dest='direct', action='store_true',
+                        help="Bulk insert messages instead of fetching them through the fake API.")
+    parser.add_argument('--database', dest='database', help="Database URL; defaults to a fresh SQLite file.")
+    parser.add_argument('--label', dest='label', default='', help="Tag for this run, e.g. a release.")
+    parser.add_argument('--output', dest='output', help="Append results here instead of printing them.")
+    args = parser.parse_args()
+
+    # results go to stdout or --output as JSON lines; anything else printed goes to stderr
+    with contextlib.ExitStack() as stack:
+        out = stack.enter_context(open(args.output, 'a')) if args.output else sys.stdout
+        stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+        run(args, out)
@@ -1,27 +1,45 @@
 import argparse
 import json
 import os
+import signal
+import sys
+import threading
+import time
 
 import bottle
-import dataset
-import requests
 
+import metrics
 from analyzer import Analyzer
+from cache import CAPACITY, ResponseCache
 from gen import Generator
-from groupme import GroupMe
+from groupme import API_URL, LIKE_WINDOW, GroupMe, connect
+from likesync import INTERVAL, LikeSync
+from outbox import RATE, Outbox
+from pool import SIZE, SentencePool
+from registry import GroupRegistry, group_configs
+from timeline import day_of, format_day, parse_day
+from tokenizer import tokenize
+from writebehind import BATCH_SIZE as WRITE_BATCH_SIZE, INTERVAL as WRITE_INTERVAL, WriteBehind
 
 LIMIT = 450
 
+# seconds close() waits for queued replies to be delivered
+CLOSE_TIMEOUT = 10
+
 HELP_MESSAGE = """Hi! I'm a simple GroupMe bot. Here's what I can do:
 /bot ping: returns "hello world"
 /bot mimic <x>: returns a random sentence, based on what <x> has said
+/bot mimic <x> order <n>: the same, looking back at most <n> words (1-7)
 /bot words: returns most common words
 /bot words for <x>: takes a name and gets their words
+/bot words since <date>: most common words since <date> (e.g., 2026-09-01)
+/bot words last <n>d: most common words in the last <n> days (or <n>w for weeks)
 /bot likes from <x>: gets list of people <x> has liked
 /bot likes to <x>: gets list of people who like <x>
 /bot ego: gets list of people who've liked their own messages
 /bot rank: ranks everyone
 /bot rank <x>: ranks <x> overall
+/bot rank since <date>, /bot rank <x> last <n>d: the same, counting only that stretch of time
 /bot ratio for <x>: likes received/message sent
 /bot find me true love: finds you true love <3
 /bot help: prints this message
@@ -59,6 +77,25 @@ def _process(message):
     return message['text'].strip().split(" ")
 
 
+def _time_range(command):
+    # strips a trailing "since YYYY-MM-DD" or "last <n>d" / "last <n>w" off a command, returning the rest and
+    # the first day counted (None for all time); raises ValueError if the range can't be read
+    if len(command) < 4 or command[-2] not in ("since", "last"):
+        return command, None
+
+    if command[-2] == "since":
+        return command[:-2], parse_day(command[-1])
+
+    amount, unit = command[-1][:-1], command[-1][-1:]
+    if not amount.isdigit() or int(amount) < 1 or unit not in ("d", "w"):
+        raise ValueError(command[-1])
+    return command[:-2], day_of(time.time()) - int(amount) * (7 if unit == "w" else 1) + 1
+
+
+def _format_since(since):
+    return "" if since is None else "Since {}:\n".format(format_day(since))
+
+
 def _format_rank(rank):
     if rank == -1:
         return "(not ranked)"
@@ -70,20 +107,29 @@ def _format_rank(rank):
     }.get(rank, '{}th').format(rank)
 
 
-class BotEngine(bottle.Bottle):
-    def __init__(self, config_dict, analyzer: Analyzer, generator: Generator, database: GroupMe, console_mode=False):
-        super(BotEngine, self).__init__()
-        self.post('/groupme/callback', callback=self.receive)
-
-        self.bot_id = config_dict.get('bot_id')
-        if not self.bot_id:
-            raise Exception("No bot_id found!")
-
+class GroupBot:
+    # answers commands and reads messages for one group; send(bot_id, text) delivers a reply
+    def __init__(self, config_dict, analyzer: Analyzer, generator: Generator, database: GroupMe, send):
+        self.bot_id = config_dict['bot_id']
         self.analyzer = analyzer
         self.generator = generator
         self.database = database
+        self.send = send
 
-        self.console_mode = console_mode
+        # replies to read-only commands, dropped as new messages touch what they were computed from
+        self.cache = ResponseCache(config_dict.get('cache_size', CAPACITY))
+        analyzer.listeners.append(self.cache.invalidate)
+
+        # sentences generated ahead of /bot mimic; a mimic_pool_size of 0 generates each one on request
+        pool_size = config_dict.get('mimic_pool_size', SIZE)
+        self.pool = SentencePool(generator, size=pool_size) if pool_size else None
+
+        # recent messages whose likes sync_likes re-checks
+        self.like_window = config_dict.get('like_sync_window', LIKE_WINDOW)
+
+        # held while reading or answering a message, or applying synced likes, so the models only ever
+        # change from one thread at a time
+        self.lock = threading.Lock()
 
     def ping(self, message):
         return "Hello, world!"
@@ -93,19 +139,40 @@ class BotEngine(bottle.Bottle):
         if len(command) < 3:
             return _unrecognized_command(message, "/bot mimic {name}")
 
+        order = None
+        if len(command) >= 5 and command[-2] == "order":
+            if not command[-1].isdigit() or not 1 <= int(command[-1]) <= self.generator.k:
+                return "Order must be a number from 1 to {}.".format(self.generator.k)
+            order = int(command[-1])
+            command = command[:-2]
+
         name = " ".join(command[2:])
         uid = message['user_id'] if name == "me" else self.database.get_uid(name)
         if not uid:
             return _unrecognized_user(name)
 
-        return "{}: \"{}\"".format(self.database.get_name(uid), self.generator.generate(uid, 30, cut=False))
+        if order is None and self.pool:
+            sentence = self.pool.take(uid)
+        else:
+            sentence = self.generator.generate(uid, 30, order=order)
+        return "{}: \"{}\"".format(self.database.get_name(uid), sentence)
 
     def words(self, message):
-        command = _process(message)
+        try:
+            command, since = _time_range(_process(message))
+        except ValueError:
+            return _unrecognized_command(message, "/bot words since YYYY-MM-DD or /bot words last {n}d")
+
+        if since is not None:
+            if len(command) != 2:
+                return _unrecognized_command(message, "/bot words since YYYY-MM-DD or /bot words last {n}d")
+            return self._cached(('words since', since), {"words"}, lambda: "Most common words since {}: {}".format(
+                format_day(self.analyzer.counted_since(since)),
+                ", ".join(word for word, _ in self.analyzer.get_top_words(since=since))))
+
         if len(command) == 2:
-            words = self.analyzer.most_common_words
-            return "Most common words: {}".format(", ".join(
-                sorted(words, key=lambda word: sum(words[word].values()), reverse=True)[:15]))
+            return self._cached(('words', None), {"words"}, lambda: "Most common words: {}".format(
+                ", ".join(word for word, _ in self.analyzer.get_top_words())))
 
         if len(command) == 3:
             return _unrecognized_command(message, "/bot words or /bot words for {name}")
@@ -115,9 +182,8 @@ class BotEngine(bottle.Bottle):
         if not uid:
             return _unrecognized_user(name)
 
-        words = self.analyzer.mcw_per_user[uid]
-        return "Most common words for {}: {}".format(
-            self.database.get_name(uid), ", ".join(sorted(words, key=words.get, reverse=True)[:15]))
+        return self._cached(('words', uid), {"words:" + uid}, lambda: "Most common words for {}: {}".format(
+            self.database.get_name(uid), ", ".join(word for word, _ in self.analyzer.get_top_words(uid))))
 
     def likes(self, message):
         command = _process(message)
@@ -131,18 +197,36 @@ class BotEngine(bottle.Bottle):
 
         direction = command[2]
         if direction == "from":
-            liked = self.analyzer.user_likes[uid]
-            return "{} has liked a total of {} messages, most frequently from: {}".format(
-                self.database.get_name(uid), sum(liked.values()), ", ".join([
-                    self.database.get_name(_uid) for _uid in sorted(liked, key=liked.get, reverse=True)[:15]]))
+            return self._cached(('likes from', uid), {"sent:" + uid}, lambda: self._likes_from(uid))
         elif direction == "to":
-            likes = self.analyzer.likes_per_user[uid]
-            return "{} has received {} likes, most frequently from: {}".format(
-                self.database.get_name(uid), sum(likes.values()), ", ".join([
-                    self.database.get_name(_uid) for _uid in sorted(likes, key=likes.get, reverse=True)[:15]]))
+            return self._cached(('likes to', uid), {"received:" + uid}, lambda: self._likes_to(uid))
         else:
             return _unrecognized_command(message, "/bot likes from {user} or /bot likes to {user}")
 
+    def _likes_from(self, uid):
+        total, liked = self.analyzer.get_likes_from(uid)
+        return "{} has liked a total of {} messages, most frequently from: {}".format(
+            self.database.get_name(uid), total, ", ".join([self.database.get_name(_uid) for _uid, _ in liked]))
+
+    def _likes_to(self, uid):
+        total, likers = self.analyzer.get_likes_to(uid)
+        return "{} has received {} likes, most frequently from: {}".format(
+            self.database.get_name(uid), total, ", ".join([self.database.get_name(_uid) for _uid, _ in likers]))
+
+    def true_love(self, message):
+        # whoever the sender likes, and is liked by, the most; any like can change it
+        uid = message['user_id']
+        return self._cached(('true love', uid), {"likes"}, lambda: self._true_love(uid))
+
+    def _true_love(self, uid):
+        match = self.analyzer.get_true_love(uid)
+        if match is None:
+            return "I can't find you true love yet. Try liking some messages!"
+        other, _ = match
+        return "{}, your true love is {} <3 You've liked {} of their messages and they've liked {} of yours.".format(
+            self.database.get_name(uid), self.database.get_name(other),
+            self.analyzer.likes.get(uid, other), self.analyzer.likes.get(other, uid))
+
     def ratio(self, message):
         command = _process(message)
         if len(command) < 4:
@@ -153,59 +237,93 @@ class BotEngine(bottle.Bottle):
         if not uid:
             return _unrecognized_user(name)
 
-        likes = self.analyzer.likes_per_user[uid]
-        messages = self.analyzer.messages_by_user[uid]
-
-        return "{} has a likes/messages ratio of {:.2f}.".format(
-            self.database.get_name(uid), float(sum(likes.values())) / len(messages))
+        return self._cached(('ratio', uid), {"messages:" + uid, "received:" + uid},
+                            lambda: "{} has a likes/messages ratio of {:.2f}.".format(
+                                self.database.get_name(uid), self.analyzer.get_ratio_and_rank(uid)[0]))
 
     def ego(self, message):
         template = "{} has liked their own posts {} time(s)."
-        return "\n".join(
-            template.format(self.database.get_name(uid), likes) for uid, likes in self.analyzer.get_self_likes())
+        return self._cached(('ego', None), {"self_likes"}, lambda: "\n".join(
+            template.format(self.database.get_name(uid), likes) for uid, likes in self.analyzer.get_self_likes()))
 
     def rank(self, message):
-        command = _process(message)
+        try:
+            command, since = _time_range(_process(message))
+        except ValueError:
+            return _unrecognized_command(message, "/bot rank since YYYY-MM-DD or /bot rank last {n}d")
+
         if len(command) == 2:
-            return GLOBAL_RANK.format(
-                ", ".join(["{} ({})".format(self.database.get_name(uid), value)
-                           for uid, value in self.analyzer.get_most_overall_likes_sent()]),
-                ", ".join(["{} ({})".format(self.database.get_name(uid), value)
-                           for uid, value in self.analyzer.get_most_overall_likes_recd()]),
-                ", ".join(["{} ({:.2f})".format(self.database.get_name(uid), value)
-                           for uid, value in self.analyzer.get_highest_overall_ratio()])
-            )
+            return self._cached(('rank', None, since), {"ranks"}, lambda: self._global_rank(since))
 
         name = " ".join(command[2:])
         uid = message['user_id'] if name == "me" else self.database.get_uid(name)
         if not uid:
             return _unrecognized_user(name)
 
-        likes_sent, sent_rank = self.analyzer.get_likes_sent_and_rank(uid)
-        likes_recd, recd_rank = self.analyzer.get_likes_received_and_rank(uid)
-        ratio, ratio_rank = self.analyzer.get_ratio_and_rank(uid)
+        return self._cached(('rank', uid, since), {"ranks"}, lambda: self._user_rank(uid, since))
+
+    def _global_rank(self, since=None):
+        return _format_since(self.analyzer.counted_since(since)) + GLOBAL_RANK.format(
+            ", ".join(["{} ({})".format(self.database.get_name(uid), value)
+                       for uid, value in self.analyzer.get_most_overall_likes_sent(since=since)]),
+            ", ".join(["{} ({})".format(self.database.get_name(uid), value)
+                       for uid, value in self.analyzer.get_most_overall_likes_recd(since=since)]),
+            ", ".join(["{} ({:.2f})".format(self.database.get_name(uid), value)
+                       for uid, value in self.analyzer.get_highest_overall_ratio(since=since)])
+        )
 
-        return USER_RANK.format(
+    def _user_rank(self, uid, since=None):
+        likes_sent, sent_rank = self.analyzer.get_likes_sent_and_rank(uid, since)
+        likes_recd, recd_rank = self.analyzer.get_likes_received_and_rank(uid, since)
+        ratio, ratio_rank = self.analyzer.get_ratio_and_rank(uid, since)
+
+        return _format_since(self.analyzer.counted_since(since)) + USER_RANK.format(
             name=self.database.get_name(uid),
             like_recd_count=likes_recd, like_recd_rank=_format_rank(recd_rank),
             like_sent_count=likes_sent, like_sent_rank=_format_rank(sent_rank),
             ratio=ratio, ratio_rank=_format_rank(ratio_rank)
         )
 
-    def receive(self, msg=None):
-        msg = msg or bottle.request.json
+    def _cached(self, key, tags, render):
+        # version is read before rendering, so a message arriving mid-render leaves the reply stale, not wrong
+        reply = self.cache.get(key)
+        if reply is None:
+            version = self.analyzer.version
+            reply = render()
+            self.cache.put(key, version, tags, reply)
+        return reply
+
+    def sync_likes(self):
+        # stores and reads in likes that changed on recent messages; returns how many messages changed.
+        # Fetched before taking the lock: a message received meanwhile is stored with no likes, then
+        # compared, so its likes are applied here too
+        likes = self.database.fetch_recent_likes(self.like_window)
+        with self.lock:
+            changes = self.database.store_likes(likes)
+            for message, before in changes:
+                tokens = tokenize(message['text'])
+                self.analyzer.update_likes(message, before, tokens)
+                self.generator.update_likes(message, before, tokens)
+        return len(changes)
+
+    def receive(self, msg, read=None):
+        # whether a chat message is read into the models: read if given, otherwise only if it wasn't already
+        # stored (GroupMe can deliver a message twice, or the startup refresh may have fetched it)
+        with self.lock:
+            return self._receive(msg, read)
+
+    def _receive(self, msg, read=None):
         text = msg["text"]
         if not text.startswith("/bot"):
-            # read this in as a normal message
-            msg["favorited_by"] = []
-            self.database.receive_message(msg)
-            self.analyzer.read_message(msg)
-            self.generator.read_message(msg)
+            # read this in as a normal message, before anything that calls the API can hold it up
+            self._read(msg, read)
+            self._observe_sender(msg)
             return
 
+        # commands are answered with the sender's current name
+        self._observe_sender(msg)
         if text == "/bot find me true love":
-            return self.send_message(
-                "I can't provide love, but I can provide the next best thing: http://lmgtfy.com/?q=porn")
+            return self.send_message(self.true_love(msg))
 
         command = _process(msg)
         if len(command) < 2:
@@ -225,11 +343,42 @@ class BotEngine(bottle.Bottle):
         }.get(directive, _unrecognized_directive)
 
         try:
-            return self.send_message(fn(msg))
+            start = metrics.enabled and metrics.clock()
+            reply = fn(msg)
+            if metrics.enabled:
+                metrics.dispatch_seconds.observe(metrics.clock() - start,
+                                                 directive=directive if fn is not _unrecognized_directive else "")
+            return self.send_message(reply)
         except Exception as e:
             self.send_message(_error(e))
             raise e
 
+    def _read(self, msg, read):
+        msg["favorited_by"] = []
+        start = metrics.enabled and metrics.clock()
+        stored = self.database.receive_message(msg)
+        start = metrics.ingested('GroupMe.receive_message', 1, start)
+        if read is False or (read is None and stored is False):
+            return
+        tokens = tokenize(msg["text"])
+        start = metrics.ingested('tokenize', 1, start)
+        self.analyzer.read_message(msg, tokens)
+        start = metrics.ingested('Analyzer.read_message', 1, start)
+        self.generator.read_message(msg, tokens)
+        metrics.ingested('Generator.read_message', 1, start)
+
+    def _observe_sender(self, msg):
+        users = self.database.users
+        self.database.observe_sender(msg, on_refresh=self._directory_changed)
+        if self.database.users is not users:
+            self.cache.clear()
+
+    def _directory_changed(self):
+        # replies carry display names, so a directory change invalidates all of them. Called from the
+        # directory's refresh thread: taking the lock waits out a reply rendered with the old names
+        with self.lock:
+            self.cache.clear()
+
     def send_message(self, message):
         words = message.split(" ")
         splits = []
@@ -247,37 +396,177 @@ class BotEngine(bottle.Bottle):
         splits += [current]
 
         for split in splits[:5]:
-            if self.console_mode:
-                print(split)
-            else:
-                requests.post("https://api.groupme.com/v3/bots/post", {"bot_id": self.bot_id, "text": split})
+            self.send(self.bot_id, split)
+
 
+class BotEngine(bottle.Bottle):
+    # serves every configured group from one process: callbacks are routed to their group by the message's
+    # group_id, or by the bot_id in the callback URL, and each group's models are loaded on first use
+    def __init__(self, config_dict, db, console_mode=False, rebuild=False, workers=1):
+        super(BotEngine, self).__init__()
+        self.post('/groupme/callback', callback=self.receive)
+        self.post('/groupme/callback/<bot_id>', callback=self.receive)
+        self.get('/groupme/outbox', callback=self.outbox_stats)
+        self.get('/groupme/cache', callback=self.cache_stats)
+        self.get('/groupme/groups', callback=self.group_stats)
+        self.get('/groupme/metrics', callback=self.metrics_report)
+        self.get('/groupme/likes', callback=self.like_sync_stats)
+        self.get('/groupme/ready', callback=self.readiness)
+        self.get('/groupme/writes', callback=self.write_stats)
+
+        self.config_dict = config_dict
+        self.console_mode = console_mode
+
+        # replies are queued and delivered in the background, so callbacks don't wait on GroupMe
+        self.outbox = None if console_mode else Outbox(config_dict.get('api_url', API_URL),
+                                                       rate=config_dict.get('send_rate', RATE))
+
+        # received messages are stored in batches in the background, after the models have read them; a
+        # write_interval of 0 stores each one before answering instead
+        write_interval = config_dict.get('write_interval', WRITE_INTERVAL)
+        self.writer = WriteBehind(db, batch_size=config_dict.get('write_batch_size', WRITE_BATCH_SIZE),
+                                  interval=write_interval) if write_interval else None
+
+        budget = config_dict.get('memory_budget_mb')
+        self.groups = GroupRegistry(db, config_dict, self.build, memory_budget=budget and budget * 1024 * 1024,
+                                    rebuild=rebuild, workers=workers, writer=self.writer)
+
+        # likes that arrive after a message was received are picked up every like_sync_interval seconds;
+        # 0 turns this off
+        interval = config_dict.get('like_sync_interval', INTERVAL)
+        self.like_sync = LikeSync(self.groups, interval) if interval else None
+        if self.like_sync:
+            self.like_sync.start()
+
+    def build(self, config, analyzer, generator, database):
+        return GroupBot(config, analyzer, generator, database, self.send)
+
+    def send(self, bot_id, text):
+        if self.console_mode:
+            print(text)
+        else:
+            self.outbox.send(bot_id, text)
 
-def main(console_mode=False):
+    def receive(self, msg=None, bot_id=None):
+        msg = msg or bottle.request.json
+        group_id = self.groups.group_for_bot(bot_id) if bot_id else msg.get('group_id')
+        if group_id not in self.groups:
+            raise bottle.HTTPError(404, "Unknown group.")
+
+        # answered now if the group is loaded, otherwise as soon as it is. Chat messages for a group that's
+        # still loading are stored right away and read in once it has loaded
+        if msg.get('id') and not msg['text'].startswith("/bot"):
+            self.groups.submit(group_id, lambda bot, read: bot.receive(msg, read), message=msg)
+        else:
+            # a command for a group that fails to load gets the error as its reply
+            bot_id = self.groups.config(group_id)['bot_id']
+            self.groups.submit(group_id, lambda bot: bot.receive(msg),
+                               on_error=lambda e: self.send(bot_id, _error(e)))
+
+    def outbox_stats(self):
+        return self.outbox.stats() if self.outbox else {}
+
+    def cache_stats(self):
+        return {group_id: bot.cache.stats() for group_id, bot in self.groups.bots()}
+
+    def group_stats(self):
+        return self.groups.stats()
+
+    def readiness(self):
+        # 503 until the groups loading at startup are ready, for health checks during a deploy
+        report = self.groups.readiness()
+        if not report['ready']:
+            bottle.response.status = 503
+        return report
+
+    def write_stats(self):
+        return self.writer.stats() if self.writer else {}
+
+    def close(self):
+        # stores every message received so far and delivers the replies already queued
+        if self.like_sync:
+            self.like_sync.stop()
+        if self.writer:
+            self.writer.close()
+        if self.outbox:
+            self.outbox.close(CLOSE_TIMEOUT)
+
+    def like_sync_stats(self):
+        return self.like_sync.stats() if self.like_sync else {}
+
+    def metrics_report(self):
+        if not metrics.enabled:
+            raise bottle.HTTPError(404, "Metrics are disabled; set \"metrics\": true in config.json.")
+
+        for name, value in self.outbox_stats().items():
+            if value is not None:
+                metrics.outbox.set(value, stat=name)
+        for name, value in self.groups.stats().items():
+            if value is not None:
+                metrics.groups.set(value, stat=name)
+        for name, value in self.like_sync_stats().items():
+            if value is not None:
+                metrics.like_sync.set(value, stat=name)
+        for name, value in self.write_stats().items():
+            metrics.writes.set(value, stat=name)
+
+        # the cheap sizes are kept current here; transitions and bytes are set after each load. Evicted
+        # groups keep their last values
+        for group_id, bot in self.groups.bots():
+            for name, value in bot.cache.stats().items():
+                metrics.cache.set(value, group=group_id, stat=name)
+            for name, value in (bot.pool.stats() if bot.pool else {}).items():
+                metrics.mimic_pool.set(value, group=group_id, stat=name)
+            metrics.model_size.set(len(bot.analyzer.message_counts), group=group_id, model='analyzer', kind='users')
+            metrics.model_size.set(len(bot.analyzer.word_totals), group=group_id, model='analyzer',
+                                   kind='vocabulary')
+            metrics.model_size.set(len(bot.generator.m), group=group_id, model='generator', kind='users')
+            metrics.model_size.set(len(bot.generator.tokens), group=group_id, model='generator', kind='vocabulary')
+            metrics.model_size.set(sum(len(index) for index in bot.generator.m.values()), group=group_id,
+                                   model='generator', kind='positions')
+
+        bottle.response.content_type = 'text/plain; version=0.0.4; charset=utf-8'
+        return metrics.render()
+
+
+def main(console_mode=False, rebuild=False, workers=1):
     filename = os.path.join(os.path.dirname(__file__), "config.json")
     with open(filename, "r") as config_file:
         config_dict = json.loads(config_file.read())
 
-    db = dataset.connect()
-    database = GroupMe(db, config_dict)
-    analyzer = Analyzer(database)
-    generator = Generator(7, database)
-
-    database.refresh_messages()
-    analyzer.rebuild()
-    generator.rebuild()
-
-    bot = BotEngine(config_dict, analyzer, generator, database, console_mode=console_mode)
-    if console_mode:
-        while True:
-            cmd = input("Enter your command: ")
-            bot.receive({'text': cmd, 'favorited_by': [], 'user_id': "6744840"})
-    else:
-        bot.run(host='0.0.0.0')
+    if config_dict.get('metrics'):
+        metrics.enable()
+
+    db = connect()
+    bot = BotEngine(config_dict, db, console_mode=console_mode, rebuild=rebuild, workers=workers)
+
+    # groups marked "warm", and a config with a single group, load at startup; the rest load when their first
+    # message arrives
+    for config in group_configs(config_dict):
+        if config.get('warm'):
+            bot.groups.warm(config['group_id'])
+
+    # a deploy stops the bot with SIGTERM; exiting through the finally below stores what's still queued
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        if console_mode:
+            group_id = group_configs(config_dict)[0]['group_id']
+            group = bot.groups.get(group_id)
+            while True:
+                cmd = input("Enter your command: ")
+                group.receive({'text': cmd, 'favorited_by': [], 'user_id': "6744840", 'group_id': group_id})
+        else:
+            bot.run(host='0.0.0.0')
+    finally:
+        bot.close()
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Run GroupMe bot.')
     parser.add_argument('--console', dest='console_mode', action='store_true', help="Run in console mode.")
+    parser.add_argument('--rebuild', dest='rebuild', action='store_true',
+                        help="Ignore the model snapshot and rebuild from the database.")
+    parser.add_argument('--workers', dest='workers', type=int, default=1,
+                        help="Number of processes to rebuild models with, sharded by user.")
     args = parser.parse_args()
-    main(console_mode=args.console_mode)
+    main(console_mode=args.console_mode, rebuild=args.rebuild, workers=args.workers)
@@ -0,0 +1,56 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+# default number of replies kept
+CAPACITY = 256
+
+Entry = namedtuple('Entry', ['version', 'tags', 'reply'])
+
+
+class ResponseCache:
+    # LRU cache of command replies. Each reply is stored with the model version it was computed at and the
+    # tags it depends on (e.g. "words:<uid>"); the model reports the tags each new message touches, and a
+    # reply is only served while none of its tags have been touched since it was computed
+    def __init__(self, capacity=CAPACITY):
+        self.capacity = capacity
+        self.entries = OrderedDict()
+        # tag -> version of the last message that touched it
+        self.touched = {}
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None and all(self.touched.get(tag, -1) <= entry.version for tag in entry.tags):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return entry.reply
+
+            if entry is not None:
+                del self.entries[key]
+            self.misses += 1
+            return None
+
+    def put(self, key, version, tags, reply):
+        with self.lock:
+            self.entries[key] = Entry(version, frozenset(tags), reply)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.capacity:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def invalidate(self, version, tags):
+        with self.lock:
+            for tag in tags:
+                self.touched[tag] = version
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            return {'size': len(self.entries), 'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions}
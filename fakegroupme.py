@@ -0,0 +1,152 @@
+import argparse
+import random
+import threading
+from wsgiref.simple_server import WSGIRequestHandler, make_server
+
+import bottle
+
+
+class FakeGroupMe(bottle.Bottle):
+    # a local stand-in for the parts of the GroupMe API the bot uses, so fetching and posting can run offline;
+    # point a config's api_url at http://host:port/v3
+    def __init__(self, group_id, members, messages, failure_rate=0.0, seed=0):
+        super(FakeGroupMe, self).__init__()
+        self.group_id = group_id
+        self.members = members
+        self.messages = []
+        self.positions = {}
+        for message in sorted(messages, key=lambda message: message['created_at']):
+            self.add_message(message)
+
+        # fraction of requests answered with a 429 or 503, to exercise backoff
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+
+        # bot_id -> [text], in the order they arrived
+        self.posts = {}
+
+        self.get('/v3/groups', callback=self.groups)
+        self.get('/v3/groups/<group_id>', callback=self.group)
+        self.get('/v3/groups/<group_id>/messages', callback=self.group_messages)
+        self.post('/v3/bots/post', callback=self.bot_post)
+
+    def add_message(self, message):
+        # messages are kept oldest first
+        self.positions[message['id']] = len(self.messages)
+        self.messages.append(message)
+
+    def like(self, message_id, user_id):
+        # likes change in place, as they do on GroupMe, so the next fetch sees them
+        with self.lock:
+            likers = self.messages[self.positions[message_id]]['favorited_by']
+            if user_id not in likers:
+                likers.append(user_id)
+
+    def unlike(self, message_id, user_id):
+        with self.lock:
+            likers = self.messages[self.positions[message_id]]['favorited_by']
+            if user_id in likers:
+                likers.remove(user_id)
+
+    def _maybe_fail(self):
+        with self.lock:
+            roll = self.random.random()
+        if roll < self.failure_rate / 2:
+            raise bottle.HTTPResponse(status=429, headers={'Retry-After': '0'})
+        if roll < self.failure_rate:
+            raise bottle.HTTPResponse(status=503)
+
+    def _group(self):
+        return {
+            'id': self.group_id,
+            'members': self.members,
+            'messages': {'count': len(self.messages)},
+        }
+
+    def groups(self):
+        self._maybe_fail()
+        return {'response': [self._group()]}
+
+    def group(self, group_id):
+        self._maybe_fail()
+        if group_id != self.group_id:
+            raise bottle.HTTPResponse(status=404)
+        return {'response': self._group()}
+
+    def group_messages(self, group_id):
+        # like GroupMe: before_id pages newest first, after_id pages oldest first, 304 when there's nothing left
+        self._maybe_fail()
+        if group_id != self.group_id:
+            raise bottle.HTTPResponse(status=404)
+
+        query = bottle.request.query
+        limit = min(int(query.get('limit', 20)), 100)
+        if query.get('before_id'):
+            end = self.positions[query['before_id']]
+            page = self.messages[max(0, end - limit):end][::-1]
+        elif query.get('after_id'):
+            start = self.positions[query['after_id']] + 1
+            page = self.messages[start:start + limit]
+        else:
+            page = self.messages[-limit:][::-1]
+
+        if not page:
+            raise bottle.HTTPResponse(status=304)
+        return {'response': {'count': len(self.messages), 'messages': page}}
+
+    def bot_post(self):
+        self._maybe_fail()
+        form = bottle.request.forms
+        with self.lock:
+            self.posts.setdefault(form.get('bot_id'), []).append(form.getunicode('text'))
+        raise bottle.HTTPResponse(status=202)
+
+
+class _QuietHandler(WSGIRequestHandler):
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+def serve(app, host='127.0.0.1', port=0):
+    # serves app from a background thread; port 0 picks a free port, read it back from server.server_port
+    server = make_server(host, port, app, handler_class=_QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def sample_group(group_id='1', users=20, count=1000, seed=0):
+    # a small group with uniformly random chatter, for trying the fake server by hand
+    rnd = random.Random(seed)
+    members = [{'user_id': str(100 + i), 'nickname': 'user{}'.format(i), 'name': 'User {}'.format(i)}
+               for i in range(users)]
+    vocabulary = ['word{}'.format(i) for i in range(500)]
+
+    messages = []
+    for i in range(count):
+        sender = rnd.choice(members)
+        messages.append({
+            'id': str(10 ** 17 + i),
+            'group_id': group_id,
+            'user_id': sender['user_id'],
+            'name': sender['name'],
+            'sender_type': 'user',
+            'system': False,
+            'created_at': 1500000000 + 60 * i,
+            'text': " ".join(rnd.choice(vocabulary) for _ in range(rnd.randint(1, 20))),
+            'favorited_by': [member['user_id'] for member in rnd.sample(members, rnd.randint(0, 3))],
+        })
+    return members, messages
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run a fake GroupMe API.')
+    parser.add_argument('--port', dest='port', type=int, default=8081, help="Port to listen on.")
+    parser.add_argument('--group', dest='group_id', default='1', help="Group id to serve.")
+    parser.add_argument('--messages', dest='count', type=int, default=1000, help="Number of messages to serve.")
+    parser.add_argument('--failure-rate', dest='failure_rate', type=float, default=0.0,
+                        help="Fraction of requests to fail with a 429 or 503.")
+    args = parser.parse_args()
+
+    members, messages = sample_group(args.group_id, count=args.count)
+    FakeGroupMe(args.group_id, members, messages, failure_rate=args.failure_rate).run(port=args.port)
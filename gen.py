@@ -1,67 +1,188 @@
-import json
-import random
-from collections import defaultdict
-
-from tqdm import tqdm
-
+import sys
+import threading
+from array import array
+from functools import partial
+from itertools import accumulate
+from typing import Dict, List
+
+import pipeline
 from groupme import GroupMe
+from sampling import BOS, SuffixIndex
+from tokenizer import tokenize
 
 
 class Generator:
+    # k is the longest context generation conditions on; any shorter order can be asked for per call
     def __init__(self, k, database: GroupMe):
         self.database = database
         self.k = k
-        # user_id -> (phrase -> [next words])
-        self.m = defaultdict(lambda: defaultdict(list))
 
-    def rebuild(self):
-        for message in tqdm(self.database.messages(), desc="Rebuilding generator models"):
-            self.read_message(json.loads(message['object']))
-
-    def read_message(self, message):
-        text = message['text']
-        sender = message['user_id']
-        likes = len(message['favorited_by'])
-        words = text.split(" ")
-
-        for i in range(len(words) - self.k):
-            # store every k-length interval
-            window = " ".join(words[i:i + self.k])
-            self.m[sender][window] += [words[i + self.k]] * (likes + 1)
-
-        # make sure the last interval exists as well
-        window = " ".join(words[(-1 * self.k):])
-        # the 2nd self.m[window] will either preserve or set to [] the first
-        self.m[sender][window] = self.m[sender][window]
-
-    def generate(self, uid, length, cut=False):
-        output = self.k_random_words(uid)
-
-        for i in range(self.k, length):
-            window = " ".join(output[(i - self.k):])
-            letters = self.m[uid][window]
-
-            if len(letters) == 0:
-                if cut:
-                    return output
-                seed = self.k_random_words(uid)
-                if i + self.k > length:
-                    seed = seed[:(length - i)]
-
-                i += self.k
-                output += seed
-            else:
-                output += [random.choice(letters)]
+        # every word is interned once: token -> id, and id -> token
+        self.token_ids: Dict[str, int] = {}
+        self.tokens: List[str] = []
 
-        print(output)
-        return " ".join(output)
+        # user_id -> their messages as token ids, indexed for every context of 1..k tokens at once
+        self.m: Dict[str, SuffixIndex] = {}
 
-    def k_random_words(self, speaker):
-        keys = self.m[speaker].keys()
-        wkeys = []
+        # held while reading or generating, so background generation never sees an index mid-update
+        self.lock = threading.Lock()
+        # called with a user_id whenever that user's model changes
+        self.listeners = []
 
-        for s in keys:
-            letters = self.m[speaker][s]
-            wkeys += [s] * len(letters)
+    def rebuild(self):
+        pipeline.run(self.database, {'generator': self})
+
+    def shard_factory(self):
+        # builds an empty copy for a pipeline worker process
+        return partial(Generator, self.k, None)
+
+    def snapshot_config(self):
+        return {'k': self.k}
+
+    def to_snapshot(self):
+        # tokens as one UTF-8 blob with end offsets; each user's token ids, weights and suffix array, concatenated
+        encoded = [token.encode('utf-8') for token in self.tokens]
+        token_ends = array('q', accumulate(len(token) for token in encoded))
+        token_data = array('B', b"".join(encoded))
+
+        users = []
+        tokens = array('i')
+        weights = array('i')
+        suffixes = array('i')
+        for uid, index in self.m.items():
+            users.append([uid, len(index)])
+            tokens.extend(index.tokens)
+            weights.extend(index.weights)
+            suffixes.extend(index.suffixes())
+
+        return {'users': users}, {
+            'token_ends': token_ends,
+            'token_data': token_data,
+            'tokens': tokens,
+            'weights': weights,
+            'suffixes': suffixes,
+        }
+
+    def load_snapshot(self, meta, arrays):
+        token_data = arrays['token_data']
+        start = 0
+        ids = array('i')
+        for end in arrays['token_ends']:
+            ids.append(self.intern(str(token_data[start:end], 'utf-8')))
+            start = end
+
+        # suffix arrays are sorted by token id, so they only carry over if every token kept its id
+        same_ids = ids == array('i', range(len(ids)))
+
+        start = 0
+        for uid, count in meta['users']:
+            end = start + count
+            if same_ids:
+                tokens = array('i', arrays['tokens'][start:end])
+            else:
+                tokens = array('i', (BOS if tid == BOS else ids[tid] for tid in arrays['tokens'][start:end]))
+            weights = array('i', arrays['weights'][start:end])
 
-        return random.choice(wkeys).split(" ")
+            if uid not in self.m:
+                self.m[uid] = SuffixIndex.restore(
+                    self.k, tokens, weights, array('i', arrays['suffixes'][start:end]) if same_ids else None)
+            else:
+                # every stored message starts with BOS, so they append as they are
+                self.m[uid].tokens.extend(tokens)
+                self.m[uid].weights.extend(weights)
+            start = end
+
+    def intern(self, token):
+        tid = self.token_ids.get(token)
+        if tid is None:
+            tid = self.token_ids[token] = len(self.tokens)
+            self.tokens.append(token)
+        return tid
+
+    def read_message(self, message, tokens=None):
+        ids = [self.intern(word) for word in (tokens or tokenize(message['text'])).raw]
+        if not ids:
+            return
+
+        with self.lock:
+            index = self.m.get(message['user_id'])
+            if index is None:
+                index = self.m[message['user_id']] = SuffixIndex(self.k)
+            # weighted by likes instead of replicating the message
+            index.add(ids, len(message['favorited_by']) + 1)
+
+        for listener in self.listeners:
+            listener(message['user_id'])
+
+    def update_likes(self, message, before, tokens=None):
+        # message was read with before as its likers and now has favorited_by instead; its weight follows
+        ids = [self.token_ids.get(word) for word in (tokens or tokenize(message['text'])).raw]
+        if not ids or None in ids or len(before) == len(message['favorited_by']):
+            return
+
+        with self.lock:
+            index = self.m.get(message['user_id'])
+            if index is None or not index.reweight(ids, len(before) + 1, len(message['favorited_by']) + 1):
+                return
+
+        for listener in self.listeners:
+            listener(message['user_id'])
+
+    def generate(self, uid, length, cut=False, order=None):
+        return self.generate_many(uid, 1, length, cut=cut, order=order)[0]
+
+    def generate_many(self, uid, count, length, cut=False, order=None):
+        # each sentence starts where one of uid's messages starts; where the last order tokens never
+        # occurred, backs off to shorter contexts, and at the end of a message begins another (or stops,
+        # with cut). The batch shares one lookup of every context it meets
+        with self.lock:
+            index = self.m.get(uid)
+            if index is None:
+                return [""] * count
+
+            order = min(order or self.k, self.k)
+            memo = {}
+            sentences = []
+            for _ in range(count):
+                context = array('i', [BOS])
+                output = []
+                while len(output) < length:
+                    tid = None
+                    for size in range(min(order, len(context)), 0, -1):
+                        tid = index.sample(context[-size:], memo)
+                        if tid is not None:
+                            break
+
+                    if tid is None:
+                        # uid has never said anything with words in it
+                        break
+                    if tid == BOS:
+                        if cut:
+                            break
+                        context = array('i', [BOS])
+                    else:
+                        output.append(tid)
+                        context.append(tid)
+
+                sentences.append(" ".join(self.tokens[tid] for tid in output))
+            return sentences
+
+    def size_report(self):
+        # positions are shared by every order, so this is the whole model for contexts of 1..k tokens
+        positions = segments = size = 0
+        for index in self.m.values():
+            positions += len(index)
+            segments += len(index.segments)
+            size += sys.getsizeof(index.tokens) + sys.getsizeof(index.weights)
+            size += sum(sys.getsizeof(segment.suffixes) + sys.getsizeof(segment.tree) for segment in index.segments)
+
+        size += sys.getsizeof(self.m) + sys.getsizeof(self.token_ids) + sys.getsizeof(self.tokens)
+        size += sum(sys.getsizeof(token) for token in self.tokens)
+
+        return {
+            'users': len(self.m),
+            'vocabulary': len(self.tokens),
+            'positions': positions,
+            'segments': segments,
+            'bytes': size,
+        }
@@ -1,15 +1,140 @@
 import argparse
 import json
 import os
+import queue
+import threading
+import time
+from functools import partial
 
 import dataset
 import requests
 from dataset import Table
+from requests.adapters import HTTPAdapter
+from sqlalchemy import Index, event, func, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.pool import NullPool
 from tqdm import tqdm
 
+# Message columns, by dataset type name
+MESSAGE_COLUMNS = [
+    ('message_id', 'text'),
+    ('user_id', 'text'),
+    ('text', 'text'),
+    ('favorited_by', 'text'),
+    ('timestamp', 'bigint'),
+    ('group_id', 'text'),
+    ('object', 'text'),
+]
+
+# User columns, by dataset type name
+USER_COLUMNS = [
+    ('user_id', 'text'),
+    ('nickname', 'text'),
+    ('name', 'text'),
+    ('group_id', 'text'),
+    ('object', 'text'),
+]
+
+API_URL = "https://api.groupme.com/v3"
+
+# backfill: messages per API page, messages per insert transaction, pages fetched ahead of the writer
+PAGE_LIMIT = 100
+BATCH_SIZE = 1000
+PREFETCH_PAGES = 10
+
+# export import: messages per insert transaction, and characters read from the file at a time
+IMPORT_BATCH_SIZE = 10000
+READ_SIZE = 1 << 20
+
+# like sync: how many of the most recent messages have their likes re-checked
+LIKE_WINDOW = 500
+
+# held while a GroupMe migrates the schema; a group's loader and its callbacks may both be making one
+MIGRATE_LOCK = threading.Lock()
+
+# 429s and 5xxs are retried this many times, doubling the delay from BACKOFF seconds
+RETRIES = 6
+BACKOFF = 0.5
+
+
+def connect(url=None):
+    # dataset.connect, except that dataset hands every thread the same SQLite connection, whose transactions
+    # then trip over each other; groups load, likes sync and callbacks store messages on different threads.
+    # A database file gets a connection per thread instead (which may still be closed from another thread), in
+    # WAL mode so a long read (a catch-up) doesn't hold up writes. An in-memory database only exists on its one
+    # connection, which is shared after all
+    url = url or os.environ.get('DATABASE_URL', 'sqlite://')
+    if not url.startswith('sqlite'):
+        return dataset.connect(url)
+    if url in ('sqlite://', 'sqlite:///:memory:'):
+        return dataset.connect(url, engine_kwargs={'connect_args': {'check_same_thread': False}})
+
+    db = dataset.connect(url, engine_kwargs={'poolclass': NullPool, 'connect_args': {'check_same_thread': False}})
+    event.listen(db.engine, 'connect', _use_wal)
+    return db
+
+
+def _use_wal(connection, record):
+    connection.execute("PRAGMA journal_mode=WAL")
+
+
+def read_export(f, read_size=READ_SIZE):
+    # the messages in an export's message.json (one JSON array of message objects), one at a time, holding
+    # only about read_size characters of the file in memory
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    done = False
+    while True:
+        # skip to the next message: past whitespace, the opening bracket and commas
+        while position < len(buffer) and buffer[position] in " \t\r\n,[":
+            position += 1
+        if position < len(buffer) and buffer[position] == "]":
+            return
+
+        try:
+            if position == len(buffer):
+                raise ValueError("Need more input")
+            message, position = decoder.raw_decode(buffer, position)
+        except ValueError:
+            # only a message cut off by the end of the buffer; read on
+            if done:
+                if buffer[position:].strip():
+                    raise
+                return
+            chunk = f.read(read_size)
+            done = not chunk
+            buffer = buffer[position:] + chunk
+            position = 0
+            continue
+
+        yield message
+
+
+def insert_rows(db, rows):
+    # stores message_id -> Message row in one transaction, skipping messages that are already stored; returns
+    # the message_ids stored
+    rows = dict(rows)
+    table = db['Message'].table
+    while rows:
+        ids = list(rows)
+        for i in range(0, len(ids), 500):
+            for row in db.query(select([table.c.message_id]).where(table.c.message_id.in_(ids[i:i + 500]))):
+                del rows[row['message_id']]
+
+        try:
+            if rows:
+                with db as tx:
+                    tx.executable.execute(table.insert(), list(rows.values()))
+            break
+        except IntegrityError:
+            # another thread stored one of them since the check; check again
+            continue
+    return list(rows)
+
 
 class GroupMe:
-    def __init__(self, db, config_dict):
+    def __init__(self, db, config_dict, check_api=True, writer=None):
         self.key = config_dict.get('auth_key')
         if not self.key:
             raise Exception("No auth_key set!")
@@ -18,26 +143,84 @@ class GroupMe:
         if not self.gid:
             raise Exception("No group_id set!")
 
-        r = requests.get("https://api.groupme.com/v3/groups", params={"token": self.key})
-        if r.status_code is not 200:
-            raise Exception("GroupMe API did not respond!")
+        self.api_url = config_dict.get('api_url', API_URL)
+        self.session = requests.Session()
+        self.session.mount(self.api_url, HTTPAdapter(pool_connections=1, pool_maxsize=4))
+
+        # check_api=False for work that never calls the API, like importing an export
+        if check_api:
+            r = self.api_get(self.api_url + "/groups")
+            if r.status_code != 200:
+                raise Exception("GroupMe API did not respond!")
 
-        self.group_url = "https://api.groupme.com/v3/groups/{}".format(self.gid)
-        self.messages_url = "https://api.groupme.com/v3/groups/{}/messages".format(self.gid)
+        self.group_url = "{}/groups/{}".format(self.api_url, self.gid)
+        self.messages_url = "{}/groups/{}/messages".format(self.api_url, self.gid)
 
+        self.db = db
+        # a WriteBehind that receive_message hands rows to, instead of storing them itself
+        self.writer = writer
         self.message_table: Table = db['Message']
         self.user_table: Table = db['User']
+        self.migrate()
 
-    def receive_message(self, message):
+        # held while swapping the user directory. Newcomers wait here, uid -> the name they posted under, for
+        # the background refresh of the directory, which runs while refreshing is set
+        self.users_lock = threading.Lock()
+        self.newcomers = {}
+        self.refreshing = False
+        self.load_users()
+
+    def migrate(self):
+        # brings the Message and User tables up to the current schema; older databases may hold the same message twice,
+        # so duplicates are dropped (keeping the first copy) before message_id is made unique
+        with MIGRATE_LOCK:
+            self._migrate()
+
+    def _migrate(self):
+        for name, kind in MESSAGE_COLUMNS:
+            self.message_table.create_column(name, getattr(self.db.types, kind))
+        for name, kind in USER_COLUMNS:
+            self.user_table.create_column(name, getattr(self.db.types, kind))
+
+        table = self.message_table.table
+        indexes = {index['name'] for index in self.db.inspect.get_indexes(self.message_table.name)}
+
+        if 'ix_message_group_timestamp' not in indexes:
+            Index('ix_message_group_timestamp', table.c.group_id, table.c.timestamp).create(self.db.executable)
+
+        if 'ux_message_message_id' not in indexes:
+            first_copies = select([func.min(table.c.id)]).group_by(table.c.message_id)
+            self.db.executable.execute(table.delete().where(~table.c.id.in_(first_copies)))
+            Index('ux_message_message_id', table.c.message_id, unique=True).create(self.db.executable)
+
+    def api_get(self, url, **params):
+        # GET over the pooled session, backing off on rate limits and server errors
+        delay = BACKOFF
+        for attempt in range(RETRIES + 1):
+            try:
+                r = self.session.get(url, params=dict(params, token=self.key), timeout=30)
+            except requests.ConnectionError:
+                if attempt == RETRIES:
+                    raise
+            else:
+                if (r.status_code != 429 and r.status_code < 500) or attempt == RETRIES:
+                    return r
+                if 'Retry-After' in r.headers:
+                    delay = float(r.headers['Retry-After'])
+
+            time.sleep(delay)
+            delay *= 2
+
+    def _row(self, message):
         if message["system"] or message["text"] is None:
-            return
+            return None
         elif message["sender_type"] == u'bot':
-            return
+            return None
         elif message["text"].startswith("/bot"):
             # ignore bot commands
-            return
+            return None
 
-        self.message_table.insert({
+        return {
             "message_id": message['id'],
             "user_id": message['user_id'],
             "text": message['text'],
@@ -45,72 +228,303 @@ class GroupMe:
             "timestamp": message['created_at'],
             "group_id": message['group_id'],
             "object": json.dumps(message),  # just in case
-        })
+        }
+
+    def receive_message(self, message):
+        # True if the message was stored (or, with a writer, queued to be) just now, False if it already was,
+        # None if it isn't kept
+        row = self._row(message)
+        if row and self.writer:
+            return self.writer.add(row, self.has_message)
+        if row:
+            try:
+                return bool(self.message_table.insert_ignore(row, ['message_id'], ensure=False))
+            except IntegrityError:
+                # stored by another thread between insert_ignore's check and its insert
+                return False
 
-    def refresh_messages(self):
-        most_recent_message = self.message_table.find_one(order_by='-timestamp')
-        most_recent_id = most_recent_message['message_id']
+    def insert_messages(self, messages):
+        # bulk receive_message: one transaction, skipping messages that are already stored; returns the
+        # messages that were inserted
+        rows = {}
+        inserted = {}
+        for message in messages:
+            row = self._row(message)
+            if row:
+                rows[row['message_id']] = row
+                inserted[row['message_id']] = message
 
-        r = requests.get(self.messages_url, params={'token': self.key, 'limit': 100, 'after_id': most_recent_id})
-        while r.status_code is 200:
-            messages = r.json()['response']['messages']
-            if not messages:
-                return
+        return [inserted[message_id] for message_id in insert_rows(self.db, rows)]
 
-            for message in r.json()['response']['messages']:
-                self.receive_message(message)
+    def import_export(self, f, batch_size=IMPORT_BATCH_SIZE, on_insert=None):
+        # stores the messages of an export's message.json (an open text file) in batch_size transactions,
+        # filtered like receive_message and skipping any already stored, so an interrupted import can just
+        # be run again. on_insert, if given, is called with each batch of newly inserted messages. Returns
+        # (messages read, messages inserted)
+        read = inserted = 0
+        batch = []
+        for message in tqdm(read_export(f), desc="Importing messages"):
+            read += 1
+            message.setdefault('group_id', self.gid)
+            if message['group_id'] != self.gid:
+                continue
+            batch.append(message)
+            if len(batch) >= batch_size:
+                inserted += self._import_batch(batch, on_insert)
+                batch = []
+        inserted += self._import_batch(batch, on_insert)
+        return read, inserted
 
-            last_id = messages[-1]['id']
-            r = requests.get(self.messages_url, params={'token': self.key, 'limit': 100, 'after_id': last_id})
+    def _import_batch(self, batch, on_insert):
+        messages = self.insert_messages(batch)
+        if messages and on_insert:
+            on_insert(messages)
+        return len(messages)
 
-    def recreate_messages(self):
-        self.message_table.delete()
+    def refresh_messages(self, batch_size=BATCH_SIZE, after_id=None):
+        # fetch everything newer than after_id, by default the newest stored message
+        after_id = after_id or self.newest_message_id()
+        if after_id is None:
+            # nothing stored to page forward from, so fetch the whole history instead
+            return self.recreate_messages(resume=True, batch_size=batch_size)
 
-        r = requests.get(self.messages_url, params={"token": self.key, "limit": 100})
-        count = r.json()['response']['count']
-        pbar = tqdm(total=count)
+        self._backfill('after_id', after_id, batch_size)
 
-        while r.status_code is 200:
-            messages = r.json()['response']['messages']
+    def newest_message_id(self):
+        most_recent_message = self.message_table.find_one(group_id=self.gid, order_by='-timestamp')
+        return most_recent_message and most_recent_message['message_id']
 
-            if not messages:
-                return
+    def recreate_messages(self, resume=False, batch_size=BATCH_SIZE):
+        # fetch the whole history, newest first; with resume, keep what's stored and continue from the
+        # oldest stored message, since each committed batch extends an unbroken run back from the newest
+        if not resume:
+            self.message_table.delete(group_id=self.gid)
+
+        oldest_message = self.message_table.find_one(group_id=self.gid, order_by='timestamp')
+        total = self.api_get(self.group_url).json()['response']['messages']['count']
+        self._backfill('before_id', oldest_message and oldest_message['message_id'], batch_size,
+                       total=total - self.count_messages())
+
+    def _backfill(self, direction, message_id, batch_size, total=None):
+        # a fetcher thread pages through the API while this thread writes pages in batched transactions
+        pages = queue.Queue(maxsize=PREFETCH_PAGES)
+        threading.Thread(target=self._fetch_pages, args=(direction, message_id, pages), daemon=True).start()
 
-            for message in messages:
-                self.receive_message(message)
+        pbar = tqdm(total=total)
+        batch = []
+        for page in iter(pages.get, None):
+            if isinstance(page, Exception):
+                raise page
 
-            last_id = messages[-1]["id"]
-            r = requests.get(self.messages_url, params={"token": self.key, "limit": 100, "before_id": last_id})
-            pbar.update(len(messages))
+            batch += page
+            if len(batch) >= batch_size:
+                self.insert_messages(batch)
+                batch = []
+            pbar.update(len(page))
 
+        self.insert_messages(batch)
         pbar.close()
 
-    def recreate_all_names(self):
-        self.user_table.delete()
+    def _fetch_pages(self, direction, message_id, pages):
+        try:
+            while True:
+                params = {'limit': PAGE_LIMIT}
+                if message_id:
+                    params[direction] = message_id
+
+                r = self.api_get(self.messages_url, **params)
+                if r.status_code != 200:
+                    # 304 once there's nothing left
+                    break
+
+                messages = r.json()['response']['messages']
+                if not messages:
+                    break
+                pages.put(messages)
+
+                # don't rely on the page's order: continue from its oldest or newest message
+                edge = min if direction == 'before_id' else max
+                message_id = edge(messages, key=lambda message: message['created_at'])['id']
+        except Exception as e:
+            pages.put(e)
+        pages.put(None)
 
-        r = requests.get("https://api.groupme.com/v3/groups/{}".format(self.gid), params={"token": self.key})
+    def fetch_recent_likes(self, count=LIKE_WINDOW):
+        # message_id -> favorited_by for the group's count newest messages, from the API
+        likes = {}
+        params = {'limit': PAGE_LIMIT}
+        while len(likes) < count:
+            r = self.api_get(self.messages_url, **params)
+            if r.status_code != 200:
+                # 304 once there's nothing left
+                break
+            page = r.json()['response']['messages']
+            if not page:
+                break
+            for message in page[:count - len(likes)]:
+                likes[message['id']] = message['favorited_by']
+            params['before_id'] = min(page, key=lambda message: message['created_at'])['id']
+        return likes
+
+    def store_likes(self, likes):
+        # stores message_id -> favorited_by wherever it differs from what's stored; returns (message, previous
+        # favorited_by) for each change, message projected as by projected_messages
+        changes = [(dict(message, favorited_by=likes[message['id']]), message['favorited_by'])
+                   for message in self.changed_likes(likes)]
+
+        if changes:
+            table = self.message_table.table
+            with self.db as tx:
+                for message, _ in changes:
+                    tx.executable.execute(table.update().where(table.c.message_id == message['id']).values(
+                        favorited_by=json.dumps(message['favorited_by'])))
+        return changes
+
+    def changed_likes(self, likes):
+        # the stored messages, projected, whose favorited_by differs from likes (message_id -> favorited_by);
+        # messages that aren't stored are skipped
+        for message in self.projected_messages(message_ids=list(likes)):
+            if sorted(likes[message['id']]) != sorted(message['favorited_by']):
+                yield message
+
+    def recent_likes(self, window=LIKE_WINDOW):
+        # message_id -> favorited_by for the window newest stored messages
+        table = self.message_table.table
+        query = select([table.c.message_id, table.c.favorited_by]).where(table.c.group_id == self.gid)
+        query = query.order_by(table.c.timestamp.desc(), table.c.id.desc()).limit(window)
+        return {row['message_id']: json.loads(row['favorited_by']) for row in self.db.query(query)}
+
+    def recreate_all_names(self):
+        r = self.api_get(self.group_url)
         resp = r.json()["response"]
 
-        for member in resp["members"]:
-            self.user_table.insert({
-                'user_id': member['user_id'],
-                'nickname': member['nickname'],
-                'name': member['name'],
-                'group_id': self.gid,
-                'object': json.dumps(member)
-            })
+        rows = [{
+            'user_id': member['user_id'],
+            'nickname': member['nickname'],
+            'name': member['name'],
+            'group_id': self.gid,
+            'object': json.dumps(member)
+        } for member in resp["members"]]
+
+        # inserted on the transaction's connection: insert_many would use the one of the thread that made the
+        # table, and this runs on the directory's refresh thread
+        with self.db as tx:
+            tx[self.user_table.name].delete(group_id=self.gid)
+            if rows:
+                tx.executable.execute(self.user_table.table.insert(), rows)
+
+        self.load_users()
+
+    def load_users(self):
+        # in-memory user directory: uid -> name, plus case-insensitive name -> uid and nickname -> uid
+        names, uids_by_name, uids_by_nickname = {}, {}, {}
+        for user in self.user_table.find(group_id=self.gid):
+            names[user['user_id']] = user['name']
+            uids_by_name.setdefault(user['name'].lower(), user['user_id'])
+            uids_by_nickname.setdefault(user['nickname'].lower(), user['user_id'])
+
+        # swapped in whole, so lookups never see a half-loaded directory
+        with self.users_lock:
+            self.users = (names, uids_by_name, uids_by_nickname)
+
+    def observe_sender(self, message, on_refresh=None):
+        # when someone the directory doesn't know yet posts, their posted name is used right away and the
+        # directory is refreshed from a background thread, since fetching it can take minutes of retries;
+        # on_refresh() is called once the refreshed directory is swapped in
+        uid = message.get('user_id')
+        if not uid or uid in self.users[0]:
+            return
+
+        newcomer = {uid: message.get('name') or "(former member)"}
+        self._add_names(newcomer)
+        with self.users_lock:
+            self.newcomers.update(newcomer)
+            if self.refreshing:
+                return
+            self.refreshing = True
+        threading.Thread(target=self._refresh_names, args=(on_refresh,), daemon=True).start()
+
+    def _refresh_names(self, on_refresh):
+        # refreshes until no newcomer is left waiting, so one who posts mid-fetch isn't missed
+        while True:
+            with self.users_lock:
+                newcomers, self.newcomers = self.newcomers, {}
+                if not newcomers:
+                    self.refreshing = False
+                    return
+
+            try:
+                self.recreate_all_names()
+            except Exception as e:
+                # the names they posted under will do until the next newcomer refreshes the directory
+                print("Failed to refresh the members of group {}: {}".format(self.gid, e))
+            # not current members (or the refresh failed), so remember the names they posted under rather
+            # than refetching every time
+            self._add_names(newcomers)
+            if on_refresh is not None:
+                try:
+                    on_refresh()
+                except Exception as e:
+                    print("Error after refreshing the members of group {}: {}".format(self.gid, e))
+
+    def _add_names(self, names_by_uid):
+        # adds names for uids the directory doesn't have
+        with self.users_lock:
+            names, uids_by_name, uids_by_nickname = self.users
+            missing = {uid: name for uid, name in names_by_uid.items() if uid not in names}
+            if missing:
+                names = dict(names)
+                names.update(missing)
+                self.users = (names, uids_by_name, uids_by_nickname)
 
     def messages(self):
         return self.message_table.find(group_id=self.gid)
 
+    def projected_messages(self, since=None, message_ids=None):
+        # just the fields the models read, shaped like GroupMe messages and oldest first, including messages
+        # sent at exactly since; the raw object column is never loaded or decoded. With message_ids, only
+        # those messages
+        if message_ids is not None:
+            for i in range(0, len(message_ids), 500):
+                yield from self._projected(since, message_ids[i:i + 500])
+        else:
+            yield from self._projected(since, None)
+
+    def _projected(self, since, message_ids):
+        table = self.message_table.table
+        query = select([table.c.message_id, table.c.user_id, table.c.text, table.c.favorited_by, table.c.timestamp])
+        query = query.where(table.c.group_id == self.gid)
+        if since is not None:
+            query = query.where(table.c.timestamp >= since)
+        if message_ids is not None:
+            query = query.where(table.c.message_id.in_(message_ids))
+
+        for row in self.db.query(query.order_by(table.c.timestamp, table.c.id)):
+            yield {
+                'id': row['message_id'],
+                'user_id': row['user_id'],
+                'text': row['text'],
+                'favorited_by': json.loads(row['favorited_by']),
+                'created_at': row['timestamp'],
+            }
+
+    def count_messages(self, before=None):
+        if before is None:
+            return self.message_table.count(group_id=self.gid)
+        return self.message_table.count(group_id=self.gid, timestamp={'lt': before})
+
+    def has_message(self, message_id):
+        # asked for every received message, so just the indexed message_id is read
+        table = self.message_table.table
+        query = select([table.c.message_id]).where(table.c.message_id == message_id).where(table.c.group_id == self.gid)
+        return any(True for _ in self.db.query(query.limit(1)))
+
     def get_name(self, uid):
-        user = self.user_table.find_one(user_id=uid, group_id=self.gid)
-        return user['name'] if user else "(former member)"
+        return self.users[0].get(uid, "(former member)")
 
     def get_uid(self, name):
-        user = (self.user_table.find_one(name=name, group_id=self.gid)
-                or self.user_table.find_one(nickname=name, group_id=self.gid))
-        return user['user_id'] if user else None
+        _, uids_by_name, uids_by_nickname = self.users
+        return uids_by_name.get(name.lower()) or uids_by_nickname.get(name.lower())
 
 
 if __name__ == "__main__":
@@ -121,12 +535,59 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='Refresh GroupMe database.')
     parser.add_argument('--users', dest='users', action='store_true', help="Refresh users database.")
     parser.add_argument('--messages', dest='messages', action='store_true', help="Refresh messages database.")
+    parser.add_argument('--resume', dest='resume', action='store_true',
+                        help="With --messages, continue an interrupted refresh instead of starting over.")
+    parser.add_argument('--import', dest='export', metavar='PATH',
+                        help="Import the messages in a GroupMe export's message.json; safe to run again.")
+    parser.add_argument('--feed', dest='feed', action='store_true',
+                        help="With --import, bring the group's model snapshot up to date as messages are imported.")
+    parser.add_argument('--group', dest='group_id', help="Group to work on, when the config has several.")
+    parser.add_argument('--batch-size', dest='batch_size', type=int,
+                        help="Messages written per transaction (default {}, or {} for --import).".format(
+                            BATCH_SIZE, IMPORT_BATCH_SIZE))
 
     args = parser.parse_args()
 
-    db = dataset.connect()
-    gm = GroupMe(db, config_dict)
+    # imported here, since they import this module
+    import registry
+
+    configs = registry.group_configs(config_dict)
+    if args.group_id:
+        configs = [config for config in configs if config.get('group_id') == args.group_id]
+    if len(configs) != 1:
+        raise Exception("Pick one of the configured groups with --group!")
+    config = configs[0]
+
+    db = connect()
+    # an import alone never needs the API
+    gm = GroupMe(db, config, check_api=args.users or args.messages or not args.export)
     if args.users:
         gm.recreate_all_names()
     if args.messages:
-        gm.recreate_messages()
+        gm.recreate_messages(resume=args.resume, batch_size=args.batch_size or BATCH_SIZE)
+    if args.export:
+        on_insert = None
+        if args.feed:
+            import pipeline
+            import snapshot
+            from analyzer import Analyzer
+            from gen import Generator
+
+            # bring the models up to the database first, so those fed during the import cover everything
+            models = {'analyzer': Analyzer(gm, word_capacity=config.get('word_capacity')),
+                      'generator': Generator(registry.K, gm)}
+            snapshot_path = registry.snapshot_path(config)
+            position = pipeline.run(gm, models, snapshot.load(snapshot_path, models, gm) or pipeline.EMPTY_POSITION)
+            on_insert = partial(pipeline.feed, models, position=position)
+
+        with open(args.export, "r", encoding="utf-8") as export_file:
+            read, inserted = gm.import_export(export_file, batch_size=args.batch_size or IMPORT_BATCH_SIZE,
+                                              on_insert=on_insert)
+        print("Imported {} of {} messages.".format(inserted, read))
+
+        if args.feed:
+            # then catch up on what's newer, imported or stored meanwhile by a running bot, so the snapshot's
+            # position only claims what the models have read
+            position = pipeline.run(gm, models, position)
+            snapshot.save(snapshot_path, models, position, gm.gid,
+                          likes=gm.recent_likes(config.get('like_sync_window', LIKE_WINDOW)))
@@ -0,0 +1,205 @@
+from array import array
+
+import numpy as np
+
+# users a dense matrix is kept for (4 MB at most); past this, likes are kept sparse as (liker, sender) counts
+DENSE_USERS = 1024
+
+
+class LikeMatrix:
+    # who has liked whose messages: counts[liker, sender] over interned user ids, plus messages sent per user.
+    # Likes sent and received are row and column sums, self-likes the diagonal and leaderboards an argsort,
+    # each computed for every user at once. Dense while the group is small, sparse after
+    def __init__(self):
+        # user_id -> row and column, and back
+        self.ids = {}
+        self.users = []
+        # messages sent, by id
+        self.messages = np.zeros(16, dtype=np.int64)
+
+        # dense: the top-left len(users) square of a matrix grown by doubling
+        self.dense = np.zeros((16, 16), dtype=np.int32)
+        # sparse (once dense is None): (liker, sender) -> count, and the same as arrays, rebuilt on demand
+        self.pairs = None
+        self._triples = None
+
+        # sums by id, dropped whenever a like changes
+        self._sums = None
+
+    def __len__(self):
+        return len(self.users)
+
+    def intern(self, uid):
+        i = self.ids.get(uid)
+        if i is not None:
+            return i
+
+        i = self.ids[uid] = len(self.users)
+        self.users.append(uid)
+        if i == len(self.messages):
+            self.messages = np.concatenate([self.messages, np.zeros(i, dtype=np.int64)])
+        if self.dense is not None and i == len(self.dense):
+            if i >= DENSE_USERS:
+                self._sparsify()
+            else:
+                grown = np.zeros((2 * i, 2 * i), dtype=np.int32)
+                grown[:i, :i] = self.dense
+                self.dense = grown
+        return i
+
+    def _sparsify(self):
+        rows, cols = np.nonzero(self.dense)
+        self.pairs = {(liker, sender): count for liker, sender, count in
+                      zip(rows.tolist(), cols.tolist(), self.dense[rows, cols].tolist())}
+        self.dense = None
+        self._triples = None
+
+    def count_message(self, uid, delta=1):
+        i = self.intern(uid)
+        self.messages[i] += delta
+
+    def add(self, liker, sender, delta=1):
+        i, j = self.intern(liker), self.intern(sender)
+        if self.dense is not None:
+            self.dense[i, j] += delta
+        else:
+            count = self.pairs.get((i, j), 0) + delta
+            if count:
+                self.pairs[(i, j)] = count
+            else:
+                del self.pairs[(i, j)]
+            self._triples = None
+        self._sums = None
+
+    def get(self, liker, sender):
+        i, j = self.ids.get(liker), self.ids.get(sender)
+        if i is None or j is None:
+            return 0
+        if self.dense is not None:
+            return int(self.dense[i, j])
+        return self.pairs.get((i, j), 0)
+
+    def triples(self):
+        # every nonzero count as arrays of likers, senders and counts
+        if self.dense is not None:
+            rows, cols = np.nonzero(self.dense[:len(self.users), :len(self.users)])
+            return rows, cols, self.dense[rows, cols].astype(np.int64)
+        if self._triples is None:
+            rows = np.fromiter((i for i, _ in self.pairs), dtype=np.int64, count=len(self.pairs))
+            cols = np.fromiter((j for _, j in self.pairs), dtype=np.int64, count=len(self.pairs))
+            counts = np.fromiter(self.pairs.values(), dtype=np.int64, count=len(self.pairs))
+            self._triples = rows, cols, counts
+        return self._triples
+
+    def sums(self):
+        # (likes sent, likes received, self-likes), each by id
+        if self._sums is None:
+            n = len(self.users)
+            if self.dense is not None:
+                square = self.dense[:n, :n].astype(np.int64)
+                self._sums = square.sum(axis=1), square.sum(axis=0), square.diagonal().copy()
+            else:
+                rows, cols, counts = self.triples()
+                mine = rows == cols
+                self._sums = (np.bincount(rows, counts, minlength=n).astype(np.int64),
+                              np.bincount(cols, counts, minlength=n).astype(np.int64),
+                              np.bincount(rows[mine], counts[mine], minlength=n).astype(np.int64))
+        return self._sums
+
+    def sent(self):
+        return self.sums()[0]
+
+    def received(self):
+        return self.sums()[1]
+
+    def self_likes(self):
+        return self.sums()[2]
+
+    def ratios(self):
+        # likes received / messages sent, 0 for anyone never liked
+        received = self.received()
+        messages = self.messages[:len(self.users)]
+        return np.divide(received, messages, out=np.zeros(len(received)), where=messages > 0)
+
+    def liked_by(self, liker):
+        # counts of liker's likes by sender, by id
+        return self._line(liker, 0)
+
+    def likers_of(self, sender):
+        # counts of the likes sender received by liker, by id
+        return self._line(sender, 1)
+
+    def _line(self, uid, axis):
+        n = len(self.users)
+        i = self.ids.get(uid)
+        if i is None:
+            return np.zeros(n, dtype=np.int64)
+        if self.dense is not None:
+            return (self.dense[i, :n] if axis == 0 else self.dense[:n, i]).astype(np.int64)
+        rows, cols, counts = self.triples()
+        mine = (rows if axis == 0 else cols) == i
+        return np.bincount((cols if axis == 0 else rows)[mine], counts[mine], minlength=n).astype(np.int64)
+
+    def affinity(self, uid):
+        # how much uid and each other user like each other: the share of uid's likes that went to them and
+        # the share of theirs that went to uid, combined by harmonic mean so both have to be high. By id
+        n = len(self.users)
+        i = self.ids.get(uid)
+        if i is None:
+            return np.zeros(n)
+        sent = self.sent()
+        given = _share(self.liked_by(uid), sent[i])
+        returned = _share(self.likers_of(uid), sent)
+        both = given + returned
+        scores = np.divide(2 * given * returned, both, out=np.zeros(n), where=both > 0)
+        scores[i] = 0
+        return scores
+
+    def top(self, values, limit=15):
+        # [(user_id, value)] for the highest nonzero values, ties by user_id as in RankIndex
+        order = self._order(values)
+        return [(self.users[i], values[i].item()) for i in order[:limit]]
+
+    def rank(self, values, uid):
+        # 1 for the highest value, -1 if uid's is zero
+        i = self.ids.get(uid)
+        if i is None or not values[i]:
+            return -1
+        return int(np.nonzero(self._order(values) == i)[0][0]) + 1
+
+    def _order(self, values):
+        ranked = np.nonzero(values)[0]
+        keys = np.array(self.users)[ranked]
+        return ranked[np.lexsort((keys, -values[ranked]))]
+
+    def to_arrays(self):
+        rows, cols, counts = self.triples()
+        return {
+            'like_rows': array('i', rows.astype(np.int32).tobytes()),
+            'like_cols': array('i', cols.astype(np.int32).tobytes()),
+            'like_counts': array('i', counts.astype(np.int32).tobytes()),
+        }
+
+    def load_arrays(self, users, arrays):
+        # adds counts stored by to_arrays, whose ids were users
+        ids = np.array([self.intern(uid) for uid in users], dtype=np.int64)
+        rows = ids[np.frombuffer(arrays['like_rows'], dtype=np.int32)]
+        cols = ids[np.frombuffer(arrays['like_cols'], dtype=np.int32)]
+        counts = np.frombuffer(arrays['like_counts'], dtype=np.int32)
+        if self.dense is not None:
+            np.add.at(self.dense, (rows, cols), counts)
+        else:
+            for liker, sender, count in zip(rows.tolist(), cols.tolist(), counts.tolist()):
+                self.pairs[(liker, sender)] = self.pairs.get((liker, sender), 0) + count
+            self._triples = None
+        self._sums = None
+
+    def nbytes(self):
+        if self.dense is not None:
+            return self.dense.nbytes + self.messages.nbytes
+        # a dict entry and a key tuple per pair
+        return 150 * len(self.pairs) + self.messages.nbytes
+
+
+def _share(counts, totals):
+    return np.divide(counts, totals, out=np.zeros(np.broadcast(counts, totals).shape), where=totals > 0)
@@ -0,0 +1,56 @@
+import threading
+import time
+
+# seconds between syncs
+INTERVAL = 600
+
+
+class LikeSync:
+    # live messages are stored and read with no likes, and likes keep arriving long after a message is sent.
+    # Every interval seconds this re-checks the likes on each loaded group's most recent messages and applies
+    # whatever changed to the database and the group's models (see GroupBot.sync_likes)
+    def __init__(self, groups, interval=INTERVAL):
+        self.groups = groups
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.thread = None
+
+        self.runs = 0
+        self.changed = 0
+        self.failures = 0
+        self.last_run = None
+
+    def start(self):
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+
+    def _run(self):
+        while not self.stopped.wait(self.interval):
+            self.run_once()
+
+    def run_once(self):
+        # returns how many messages had their likes changed
+        changed = 0
+        for group_id, bot in self.groups.bots():
+            try:
+                changed += bot.sync_likes()
+            except Exception as e:
+                self.failures += 1
+                print("Failed to sync likes for group {}: {}".format(group_id, e))
+
+        self.runs += 1
+        self.changed += changed
+        self.last_run = time.time()
+        return changed
+
+    def stats(self):
+        return {
+            'interval': self.interval,
+            'runs': self.runs,
+            'changed': self.changed,
+            'failures': self.failures,
+            'last_run': self.last_run,
+        }
@@ -0,0 +1,161 @@
+import threading
+import time
+from bisect import bisect_left
+
+# off until enable() is called; instrumented code checks this before reading the clock, so disabled
+# metrics cost one attribute lookup per call site
+enabled = False
+
+# histogram bucket upper bounds, in seconds
+BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+clock = time.perf_counter
+
+
+def enable():
+    global enabled
+    enabled = True
+
+
+def _labels(labels):
+    return tuple(sorted(labels.items()))
+
+
+def _format(name, labels, value, extra=()):
+    pairs = labels + tuple(extra)
+    if not pairs:
+        return "{} {}".format(name, value)
+    return "{}{{{}}} {}".format(name, ",".join(
+        '{}="{}"'.format(key, str(label).replace('\\', '\\\\').replace('"', '\\"')) for key, label in pairs), value)
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def render(self):
+        lines = ["# HELP {} {}".format(self.name, self.help), "# TYPE {} {}".format(self.name, self.kind)]
+        with self.lock:
+            for labels, value in sorted(self.values.items()):
+                lines += self._lines(labels, value)
+        return lines
+
+    def _lines(self, labels, value):
+        return [_format(self.name, labels, value)]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, value=1, **labels):
+        key = _labels(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+
+class Gauge(_Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[_labels(labels)] = value
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, buckets=BUCKETS):
+        super(Histogram, self).__init__(name, help)
+        self.buckets = buckets
+
+    def observe(self, value, **labels):
+        key = _labels(labels)
+        with self.lock:
+            counts = self.values.get(key)
+            if counts is None:
+                # a count per bucket plus one for +Inf, then the sum
+                counts = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            counts[bisect_left(self.buckets, value)] += 1
+            counts[-1] += value
+
+    def _lines(self, labels, counts):
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            total += count
+            lines.append(_format(self.name + "_bucket", labels, total, [('le', bound)]))
+        lines.append(_format(self.name + "_sum", labels, counts[-1]))
+        lines.append(_format(self.name + "_count", labels, total))
+        return lines
+
+
+# everything the bot records, rendered by render() in the Prometheus text format
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+dispatch_seconds = _register(Histogram(
+    'groupme_command_seconds', "Time to compute a reply to a /bot command, by directive."))
+ingest_messages = _register(Counter(
+    'groupme_ingest_messages_total', "Messages read, by stage."))
+ingest_seconds = _register(Counter(
+    'groupme_ingest_seconds_total', "Time spent reading messages, by stage."))
+rebuild_phase_seconds = _register(Gauge(
+    'groupme_rebuild_phase_seconds', "Duration of each phase of the last model rebuild."))
+model_size = _register(Gauge(
+    'groupme_model_size', "Size of the in-memory models, by model and kind."))
+outbox = _register(Gauge(
+    'groupme_outbox', "Outbox queue depth, delivery counts and latency percentiles."))
+cache = _register(Gauge(
+    'groupme_response_cache', "Response cache size, by group, and hit, miss and eviction counts."))
+mimic_pool = _register(Gauge(
+    'groupme_mimic_pool', "Pre-generated mimic sentences, by group: users and sentences held, hits and misses."))
+groups = _register(Gauge(
+    'groupme_groups', "Configured, loaded and loading groups, and the loaded groups' estimated bytes."))
+like_sync = _register(Gauge(
+    'groupme_like_sync', "Like sync runs, messages whose likes changed, and failures."))
+writes = _register(Gauge(
+    'groupme_writes', "Received messages waiting to be stored, flushes, rows stored, failures and rows per second."))
+
+
+class phase:
+    # records how long a block took under rebuild_phase_seconds; a no-op when metrics are disabled
+    def __init__(self, name, **labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        if enabled:
+            self.start = clock()
+        return self
+
+    def __exit__(self, *exc):
+        if enabled:
+            rebuild_phase_seconds.set(clock() - self.start, phase=self.name, **self.labels)
+
+
+def ingested(stage, count, start):
+    # records count messages read by stage since start (a clock() reading, or False when disabled), and
+    # returns the clock for the next stage
+    if not enabled:
+        return False
+    now = clock()
+    ingest_messages.inc(count, stage=stage)
+    ingest_seconds.inc(now - start, stage=stage)
+    return now
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines += metric.render()
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,98 @@
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from groupme import API_URL, BACKOFF, RETRIES
+
+# default sends per second, per worker
+RATE = 2.0
+
+# deliveries kept for the latency percentiles
+LATENCY_WINDOW = 1000
+
+
+class Outbox:
+    # delivers bot replies from background workers so the webhook can return right away. Replies from one
+    # bot always go through the same worker, so they arrive in order; each worker sends at most rate
+    # messages a second and retries 429s, 5xxs and connection errors with exponential backoff
+    def __init__(self, api_url=API_URL, workers=1, rate=RATE):
+        self.post_url = api_url + "/bots/post"
+        self.session = requests.Session()
+        self.session.mount(api_url, HTTPAdapter(pool_connections=1, pool_maxsize=workers))
+        self.interval = 1.0 / rate
+
+        self.lock = threading.Lock()
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+        # seconds from send() until GroupMe accepted the reply
+        self.latencies = deque(maxlen=LATENCY_WINDOW)
+
+        self.queues = [queue.Queue() for _ in range(workers)]
+        self.threads = [threading.Thread(target=self._work, args=(q,), daemon=True) for q in self.queues]
+        for thread in self.threads:
+            thread.start()
+
+    def send(self, bot_id, text):
+        self.queues[zlib.crc32(bot_id.encode('utf-8')) % len(self.queues)].put((bot_id, text, time.time()))
+
+    def depth(self):
+        return sum(q.qsize() for q in self.queues)
+
+    def stats(self):
+        with self.lock:
+            latencies = sorted(self.latencies)
+            stats = {'depth': self.depth(), 'sent': self.sent, 'failed': self.failed, 'retried': self.retried}
+        for name, quantile in [('latency_p50', 0.5), ('latency_p99', 0.99)]:
+            stats[name] = latencies[int(quantile * (len(latencies) - 1))] if latencies else None
+        return stats
+
+    def close(self, timeout=None):
+        # deliver everything already queued, then stop the workers
+        for q in self.queues:
+            q.put(None)
+        for thread in self.threads:
+            thread.join(timeout)
+
+    def _work(self, q):
+        next_send = 0.0
+        for bot_id, text, queued_at in iter(q.get, None):
+            time.sleep(max(0.0, next_send - time.time()))
+            delivered = self._deliver(bot_id, text)
+            next_send = time.time() + self.interval
+
+            with self.lock:
+                if delivered:
+                    self.sent += 1
+                    self.latencies.append(time.time() - queued_at)
+                else:
+                    self.failed += 1
+
+    def _deliver(self, bot_id, text):
+        delay = BACKOFF
+        for attempt in range(RETRIES + 1):
+            if attempt:
+                with self.lock:
+                    self.retried += 1
+                time.sleep(delay)
+                delay *= 2
+
+            try:
+                r = self.session.post(self.post_url, {"bot_id": bot_id, "text": text}, timeout=30)
+            except requests.RequestException:
+                continue
+
+            if r.status_code < 300:
+                return True
+            if r.status_code != 429 and r.status_code < 500:
+                # a bad bot_id or message won't get better by retrying
+                return False
+            if 'Retry-After' in r.headers:
+                delay = float(r.headers['Retry-After'])
+
+        return False
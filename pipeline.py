@@ -0,0 +1,189 @@
+import multiprocessing
+import zlib
+from queue import Empty, Full
+
+from tqdm import tqdm
+
+import metrics
+from groupme import GroupMe
+from tokenizer import tokenize_all
+
+# position of a model that has read nothing yet
+EMPTY_POSITION = {'timestamp': None, 'message_ids': [], 'count': 0}
+
+# messages tokenized, or handed to a shard worker, at a time
+CHUNK_SIZE = 1000
+
+# seconds between checks that the shard workers are still alive, while waiting on them
+POLL_INTERVAL = 1.0
+
+
+def run(database: GroupMe, models, position=EMPTY_POSITION, workers=1, progress=None, watch=None):
+    # stream every message newer than position from the database once, projected to the fields the models
+    # read, and feed it to every model; returns the new position. With workers > 1 the messages are sharded
+    # by user_id across processes that build partial models, which are then merged into models.
+    # progress, a dict, is kept up to date with how many messages have been read out of about how many,
+    # instead of showing a progress bar. watch maps ids of messages stored while this runs to whether they
+    # still need reading; any this run reads no longer do
+    cursor = _Cursor(database, position, progress, watch)
+    if progress is None:
+        messages = tqdm(cursor, desc="Rebuilding models" if position['timestamp'] is None else "Catching up models")
+    else:
+        progress.update(read=0, total=max(0, database.count_messages() - position['count']))
+        messages = cursor
+
+    if workers <= 1:
+        for chunk in _chunks(messages):
+            _read(models, chunk)
+        return cursor.position
+
+    context = multiprocessing.get_context()
+    factories = {name: model.shard_factory() for name, model in models.items()}
+    queues = [context.Queue(maxsize=4) for _ in range(workers)]
+    results = context.Queue()
+    processes = [context.Process(target=_work, args=(factories, queue, results), daemon=True) for queue in queues]
+    for process in processes:
+        process.start()
+
+    # a worker that dies (killed for memory, or raising) would leave this waiting forever, so every wait
+    # checks on them and raises instead, after stopping the rest
+    try:
+        chunks = [[] for _ in range(workers)]
+        for message in messages:
+            # both models are keyed by sender, so each sender's messages stay on one shard, in order
+            shard = zlib.crc32(message['user_id'].encode('utf-8')) % workers
+            chunks[shard].append(message)
+            if len(chunks[shard]) >= CHUNK_SIZE:
+                _put(queues[shard], chunks[shard], processes[shard])
+                chunks[shard] = []
+
+        for queue, chunk, process in zip(queues, chunks, processes):
+            if chunk:
+                _put(queue, chunk, process)
+            _put(queue, None, process)
+
+        with metrics.phase('merge'):
+            for _ in processes:
+                for name, (meta, arrays) in tqdm(_get(results, processes).items(), desc="Merging model shards"):
+                    models[name].load_snapshot(meta, arrays)
+            for process in processes:
+                process.join()
+    except Exception:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for queue in queues:
+            _drain(queue)
+        raise
+
+    return cursor.position
+
+
+def _put(queue, chunk, process):
+    while True:
+        try:
+            return queue.put(chunk, timeout=POLL_INTERVAL)
+        except Full:
+            if not process.is_alive():
+                raise Exception("A model shard worker exited with code {}".format(process.exitcode))
+
+
+def _drain(queue):
+    # empties a queue nothing reads anymore, so its feeder thread isn't left blocked writing chunks into it
+    queue.cancel_join_thread()
+    try:
+        while True:
+            queue.get(timeout=0.1)
+    except Empty:
+        pass
+
+
+def _get(results, processes):
+    # a worker that finished has put its result, so only one that failed means none is coming
+    while True:
+        try:
+            return results.get(timeout=POLL_INTERVAL)
+        except Empty:
+            for process in processes:
+                if process.exitcode not in (None, 0):
+                    raise Exception("A model shard worker exited with code {}".format(process.exitcode))
+
+
+def feed(models, messages, position):
+    # feeds every model the messages a catch-up from position would never reach, since they were sent before
+    # it, like an import's older ones, oldest first, and counts them into position, which then covers them.
+    # The rest are left to the catch-up
+    if position['timestamp'] is None:
+        return
+    behind = [message for message in messages if message['created_at'] < position['timestamp']]
+    for chunk in _chunks(sorted(behind, key=lambda message: (message['created_at'], message['id']))):
+        _read(models, chunk)
+    position['count'] += len(behind)
+
+
+def _work(factories, queue, results):
+    # forked while other threads run, so a metric lock may be held by a thread that doesn't exist here, and
+    # nothing recorded here would be reported anyway
+    metrics.enabled = False
+    models = {name: factory() for name, factory in factories.items()}
+    chunk = queue.get()
+    while chunk is not None:
+        _read(models, chunk)
+        chunk = queue.get()
+
+    results.put({name: model.to_snapshot() for name, model in models.items()})
+
+
+def _read(models, messages):
+    # tokenize once for every model; models read the chunk one after another, which they don't mind since
+    # each only depends on message order, and which lets each model's share of the time be measured.
+    # Shard workers turn metrics off, so their reads aren't counted
+    start = metrics.enabled and metrics.clock()
+    tokens = tokenize_all(message['text'] for message in messages)
+    start = metrics.ingested('tokenize', len(messages), start)
+
+    for model in models.values():
+        for message, message_tokens in zip(messages, tokens):
+            model.read_message(message, message_tokens)
+        start = metrics.ingested(type(model).__name__ + '.read_message', len(messages), start)
+
+
+def _chunks(messages):
+    chunk = []
+    for message in messages:
+        chunk.append(message)
+        if len(chunk) >= CHUNK_SIZE:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class _Cursor:
+    # iterates the messages newer than a position, oldest first, tracking the position of the last one read
+    def __init__(self, database: GroupMe, position, progress=None, watch=None):
+        self.database = database
+        self.timestamp = position['timestamp']
+        self.seen = set(position['message_ids'])
+        self.count = position['count']
+        self.progress = progress
+        self.watch = watch
+
+    @property
+    def position(self):
+        return {'timestamp': self.timestamp, 'message_ids': sorted(self.seen), 'count': self.count}
+
+    def __iter__(self):
+        for message in self.database.projected_messages(since=self.timestamp):
+            if message['created_at'] == self.timestamp and message['id'] in self.seen:
+                continue
+
+            if message['created_at'] != self.timestamp:
+                self.timestamp, self.seen = message['created_at'], set()
+            self.seen.add(message['id'])
+            self.count += 1
+            if self.progress is not None:
+                self.progress['read'] += 1
+            if self.watch and message['id'] in self.watch:
+                self.watch[message['id']] = False
+            yield message
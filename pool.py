@@ -0,0 +1,108 @@
+import queue
+import threading
+from collections import OrderedDict, deque
+
+# sentences kept ready per user, users kept ready, and words per sentence
+SIZE = 5
+USERS = 64
+LENGTH = 30
+
+# one thread refills every pool, so idle groups cost nothing
+_refills = queue.Queue()
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def _refill_forever():
+    for pool, uid in iter(_refills.get, None):
+        try:
+            pool.refill(uid)
+        except Exception as e:
+            print("Failed to refill mimic sentences: {}".format(e))
+
+
+def _schedule(pool, uid):
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = threading.Thread(target=_refill_forever, daemon=True)
+            _worker.start()
+    _refills.put((pool, uid))
+
+
+class SentencePool:
+    # pre-generated mimic sentences, so /bot mimic pops one in O(1) while a background thread tops the pool
+    # back up. Only users someone has mimicked get a pool, at most users of them (least recently mimicked
+    # dropped first) with at most size sentences each; a user's pool is emptied whenever their model changes
+    def __init__(self, generator, size=SIZE, users=USERS, length=LENGTH):
+        self.generator = generator
+        self.size = size
+        self.users = users
+        self.length = length
+
+        # user_id -> sentences, least recently mimicked first
+        self.pools = OrderedDict()
+        # user_id -> times their pool has been emptied, so a refill racing a change is thrown away
+        self.generations = {}
+        self.scheduled = set()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+        generator.listeners.append(self.invalidate)
+
+    def take(self, uid):
+        with self.lock:
+            pool = self.pools.get(uid)
+            sentence = pool.popleft() if pool else None
+            if sentence is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            if pool is None:
+                pool = self.pools[uid] = deque()
+                while len(self.pools) > self.users:
+                    evicted, _ = self.pools.popitem(last=False)
+                    self.generations.pop(evicted, None)
+            self.pools.move_to_end(uid)
+            self._schedule(uid)
+
+        return sentence if sentence is not None else self.generator.generate(uid, self.length)
+
+    def invalidate(self, uid):
+        with self.lock:
+            if uid not in self.pools:
+                return
+            self.pools[uid].clear()
+            self.generations[uid] = self.generations.get(uid, 0) + 1
+            self._schedule(uid)
+
+    def refill(self, uid):
+        with self.lock:
+            self.scheduled.discard(uid)
+            pool = self.pools.get(uid)
+            if pool is None or len(pool) >= self.size:
+                return
+            missing = self.size - len(pool)
+            generation = self.generations.get(uid, 0)
+
+        sentences = self.generator.generate_many(uid, missing, self.length)
+
+        with self.lock:
+            if self.pools.get(uid) is pool and self.generations.get(uid, 0) == generation:
+                pool.extend(sentences[:self.size - len(pool)])
+
+    def _schedule(self, uid):
+        # at most one refill queued per user
+        if uid not in self.scheduled:
+            self.scheduled.add(uid)
+            _schedule(self, uid)
+
+    def stats(self):
+        with self.lock:
+            return {
+                'users': len(self.pools),
+                'sentences': sum(len(pool) for pool in self.pools.values()),
+                'hits': self.hits,
+                'misses': self.misses,
+            }
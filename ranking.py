@@ -0,0 +1,88 @@
+import heapq
+from itertools import islice
+
+from sortedcontainers import SortedList
+
+
+class RankIndex:
+    # key -> value, kept ordered by value (highest first, ties by key) so that updates, rank lookups
+    # and top-n leaderboards are all O(log n) rather than a sort over every key
+    def __init__(self):
+        self.values = {}
+        self.order = SortedList()
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, key):
+        return key in self.values
+
+    def get(self, key, default=None):
+        return self.values.get(key, default)
+
+    def items(self):
+        return self.values.items()
+
+    def set(self, key, value):
+        if key in self.values:
+            self.order.remove((-self.values[key], key))
+        self.values[key] = value
+        self.order.add((-value, key))
+
+    def add(self, key, delta):
+        self.set(key, self.values.get(key, 0) + delta)
+
+    def discard(self, key):
+        if key in self.values:
+            self.order.remove((-self.values.pop(key), key))
+
+    def rank(self, key):
+        # 1 for the highest value, -1 if key isn't ranked
+        if key not in self.values:
+            return -1
+        return self.order.index((-self.values[key], key)) + 1
+
+    def top(self, limit):
+        return [(key, -value) for value, key in islice(self.order, limit)]
+
+    def bottom(self):
+        value, key = self.order[-1]
+        return key, -value
+
+
+class Tally(dict):
+    # plain exact counts; cheaper to update than a RankIndex when top() is rarely asked for
+    def add(self, key, delta):
+        self[key] = self.get(key, 0) + delta
+
+    def top(self, limit):
+        return heapq.nlargest(limit, self.items(), key=lambda item: item[1])
+
+
+class SpaceSaving:
+    # approximate counts in bounded memory (the Space-Saving heavy-hitters summary): at most capacity keys
+    # are kept, and a new key arriving when full takes over the smallest counter, so any key seen more than
+    # total / capacity times is always present and no count is ever underestimated
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = RankIndex()
+
+    def __len__(self):
+        return len(self.counts)
+
+    def get(self, key, default=None):
+        return self.counts.get(key, default)
+
+    def items(self):
+        return self.counts.items()
+
+    def add(self, key, delta):
+        if key not in self.counts and len(self.counts) >= self.capacity:
+            evicted, floor = self.counts.bottom()
+            self.counts.discard(evicted)
+            self.counts.set(key, floor + delta)
+        else:
+            self.counts.add(key, delta)
+
+    def top(self, limit):
+        return self.counts.top(limit)
@@ -0,0 +1,312 @@
+import os
+import queue
+import threading
+from collections import OrderedDict
+from functools import partial
+
+import metrics
+import pipeline
+import snapshot
+from analyzer import Analyzer
+from gen import Generator
+from groupme import LIKE_WINDOW, GroupMe
+
+# Markov window size for every group's generator
+K = 7
+
+
+def group_configs(config_dict):
+    # one config per group: entries of "groups" inherit every other top-level setting (auth_key, api_url,
+    # ...), and a config without "groups" is a single group as before, loaded at startup unless it says
+    # "warm": false
+    if 'groups' not in config_dict:
+        return [dict(config_dict, warm=config_dict.get('warm', True))]
+
+    shared = {key: value for key, value in config_dict.items() if key != 'groups'}
+    configs = []
+    for group in config_dict['groups']:
+        config = dict(shared, **group)
+        if 'snapshot_path' not in group:
+            config['snapshot_path'] = os.path.join(
+                os.path.dirname(__file__), "models.{}.snapshot".format(config['group_id']))
+        configs.append(config)
+    return configs
+
+
+def snapshot_path(config):
+    return config.get('snapshot_path', os.path.join(os.path.dirname(__file__), "models.snapshot"))
+
+
+class _Slot:
+    # a group's place in the registry: its loaded bot, or the work waiting for it to load
+    def __init__(self, config):
+        self.config = config
+        self.bot = None
+        self.bytes = 0
+        self.pending = []
+        self.loading = False
+        # whether it has loaded at least once; an evicted group has, so it doesn't count against readiness
+        self.warmed = False
+
+        # while loading: what the load is doing, for readiness checks
+        self.progress = None
+        # ids of chat messages stored while the group was loading -> whether the models still need to read
+        # them, which they don't if the load's catch-up got to them first
+        self.early = {}
+        # stores those messages; made on first use, since it doesn't need the API
+        self.database = None
+        # the newest message stored before the first load attempt began or the first message was stored
+        # early, whichever came first. The load's refresh pages forward from it, since a message stored early
+        # is newer than the ones sent while the bot was down; kept until a load succeeds, so a retry does too
+        self.refresh_from = None
+        self.marked = False
+        self.mark_lock = threading.Lock()
+
+
+class GroupRegistry:
+    # loads each group's models on first use and keeps the most recently used ones in memory, evicting the
+    # least recently used once their estimated size passes memory_budget bytes. Loads run on a background
+    # thread; work for a group that isn't loaded yet waits for it, in order.
+    def __init__(self, db, config_dict, build, memory_budget=None, rebuild=False, workers=1, writer=None):
+        self.db = db
+        # the WriteBehind every group's received messages are stored through, if any
+        self.writer = writer
+        # build(config, analyzer, generator, database) makes the object handed to work for that group
+        self.build = build
+        self.memory_budget = memory_budget
+        self.workers = workers
+
+        self.slots = {}
+        self.groups_by_bot = {}
+        for config in group_configs(config_dict):
+            if not config.get('group_id'):
+                raise Exception("No group_id set!")
+            if not config.get('bot_id'):
+                raise Exception("No bot_id found for group {}!".format(config['group_id']))
+            self.slots[config['group_id']] = _Slot(config)
+            self.groups_by_bot[config['bot_id']] = config['group_id']
+
+        # group_ids that still have to ignore their snapshot, with rebuild
+        self.unbuilt = set(self.slots) if rebuild else set()
+
+        # loaded group_ids, least recently used first
+        self.loaded = OrderedDict()
+        self.lock = threading.Lock()
+        self.loads = queue.Queue()
+        threading.Thread(target=self._work, daemon=True).start()
+
+    def __contains__(self, group_id):
+        return group_id in self.slots
+
+    def group_for_bot(self, bot_id):
+        return self.groups_by_bot.get(bot_id)
+
+    def config(self, group_id):
+        return self.slots[group_id].config
+
+    def submit(self, group_id, fn, message=None, on_error=None):
+        # calls fn(bot) with the group's bot: right away if it's loaded, otherwise once it is; if the load
+        # fails instead, on_error(exception) is called. With the chat message fn reads in, a group that isn't
+        # loaded stores it right away, so it survives a restart during the load, and fn is called as
+        # fn(bot, read), read saying whether the models still need it (None if the message wasn't stored early)
+        slot = self.slots[group_id]
+        if message is not None:
+            if slot.bot is None:
+                self._store_early(slot, message)
+            fn = partial(self._read_once, slot, fn, message['id'])
+
+        with self.lock:
+            bot = slot.bot
+            if bot is None:
+                slot.pending.append((fn, on_error))
+                self._schedule(slot)
+            else:
+                self.loaded.move_to_end(group_id)
+
+        if bot is not None:
+            return fn(bot)
+
+    def _store_early(self, slot, message):
+        # marked before it's stored, so a catch-up that reads it sees the mark
+        with self.lock:
+            fresh = message['id'] not in slot.early
+            if fresh:
+                slot.early[message['id']] = True
+        if slot.database is None:
+            slot.database = GroupMe(self.db, slot.config, check_api=False, writer=self.writer)
+        self._mark(slot, slot.database)
+
+        stored = slot.database.receive_message(message)
+        if fresh and not stored:
+            with self.lock:
+                if stored is None:
+                    # never stored, so left to fn like any other message
+                    del slot.early[message['id']]
+                else:
+                    # stored before, so the models have it or the catch-up will
+                    slot.early[message['id']] = False
+
+    def _mark(self, slot, database):
+        with slot.mark_lock:
+            if not slot.marked:
+                slot.refresh_from, slot.marked = database.newest_message_id(), True
+
+    def _unmark(self, slot):
+        with slot.mark_lock:
+            slot.refresh_from, slot.marked = None, False
+
+    def _read_once(self, slot, fn, message_id, bot):
+        with self.lock:
+            read = slot.early.pop(message_id, None)
+        return fn(bot, read)
+
+    def warm(self, group_id):
+        # starts loading a group in the background, if it isn't loaded already
+        with self.lock:
+            slot = self.slots[group_id]
+            if slot.bot is None:
+                self._schedule(slot)
+
+    def get(self, group_id):
+        # the group's bot, loading it first if needed; raises if the load fails
+        done = threading.Event()
+        result = []
+        errors = []
+        self.submit(group_id, lambda bot: (result.append(bot), done.set()),
+                    on_error=lambda e: (errors.append(e), done.set()))
+        done.wait()
+        if errors:
+            raise Exception("Failed to load group {}: {}".format(group_id, errors[0]))
+        return result[0]
+
+    def bots(self):
+        with self.lock:
+            return [(group_id, self.slots[group_id].bot) for group_id in self.loaded]
+
+    def stats(self):
+        with self.lock:
+            return {
+                'configured': len(self.slots),
+                'loaded': len(self.loaded),
+                'loading': sum(slot.loading for slot in self.slots.values()),
+                'bytes': sum(self.slots[group_id].bytes for group_id in self.loaded),
+                'memory_budget': self.memory_budget,
+            }
+
+    def readiness(self):
+        # ready once every group marked "warm" has loaded, with each group's state and, while it loads, how
+        # far along it is and how much work is waiting for it. Only the startup loads count: a group loading
+        # later on first use or after an eviction doesn't make a running bot unready
+        with self.lock:
+            groups = {}
+            for group_id, slot in self.slots.items():
+                state = 'loaded' if slot.bot is not None else 'loading' if slot.loading else 'unloaded'
+                groups[group_id] = dict(slot.progress or {}, state=state, pending=len(slot.pending))
+            ready = all(slot.warmed or not slot.config.get('warm') for slot in self.slots.values())
+            return {'ready': ready, 'groups': groups}
+
+    def _schedule(self, slot):
+        if not slot.loading:
+            slot.loading = True
+            self.loads.put(slot)
+
+    def _work(self):
+        for slot in iter(self.loads.get, None):
+            slot.progress = {'phase': 'starting'}
+            try:
+                bot, size = self._load(slot)
+            except Exception as e:
+                print("Failed to load group {}: {}".format(slot.config['group_id'], e))
+                with self.lock:
+                    slot.loading = False
+                    pending, slot.pending = slot.pending, []
+                    slot.progress = None
+                    slot.early = {}
+                # chat messages were stored as they arrived, so the next load reads them; the rest is told
+                for _, on_error in pending:
+                    if on_error is not None:
+                        try:
+                            on_error(e)
+                        except Exception as error:
+                            print("Error failing work for group {}: {}".format(slot.config['group_id'], error))
+                continue
+            self._unmark(slot)
+            slot.progress['phase'] = 'replay'
+
+            # run whatever queued up during the load, then publish the bot; work that arrives meanwhile
+            # keeps queueing behind it, so the group sees its messages in order
+            while True:
+                with self.lock:
+                    pending, slot.pending = slot.pending, []
+                    if not pending:
+                        slot.bot, slot.bytes, slot.loading, slot.progress = bot, size, False, None
+                        slot.warmed = True
+                        self.loaded[slot.config['group_id']] = None
+                        self._evict(slot.config['group_id'])
+                        break
+                for fn, _ in pending:
+                    try:
+                        fn(bot)
+                    except Exception as e:
+                        print("Error handling a message for group {}: {}".format(slot.config['group_id'], e))
+
+    def _evict(self, keep):
+        # drop least recently used groups until the rest fit the budget. Their snapshots already cover
+        # everything up to their load, the database holds the rest, and likes synced since are caught up
+        # from the likes the snapshot recorded, so nothing needs saving
+        if self.memory_budget is None:
+            return
+
+        total = sum(self.slots[group_id].bytes for group_id in self.loaded)
+        for group_id in list(self.loaded):
+            if total <= self.memory_budget:
+                break
+            if group_id == keep:
+                continue
+            slot = self.slots[group_id]
+            total -= slot.bytes
+            slot.bot, slot.bytes = None, 0
+            del self.loaded[group_id]
+
+    def _load(self, slot):
+        config, progress = slot.config, slot.progress
+        group_id = config['group_id']
+        database = GroupMe(self.db, config, writer=self.writer)
+        analyzer = Analyzer(database, word_capacity=config.get('word_capacity'))
+        generator = Generator(K, database)
+        models = {'analyzer': analyzer, 'generator': generator}
+
+        progress['phase'] = 'refresh'
+        self._mark(slot, database)
+        with metrics.phase('refresh', group=group_id):
+            if slot.refresh_from is None:
+                # nothing was stored before, so fetch the history behind whatever has been stored since
+                database.recreate_messages(resume=True)
+            else:
+                database.refresh_messages(after_id=slot.refresh_from)
+            # the catch-up reads what's stored, which has to include what was received before an eviction.
+            # Written after the refresh, so the refresh pages forward from what was stored before them
+            if self.writer:
+                self.writer.flush()
+
+        path = snapshot_path(config)
+        progress['phase'] = 'snapshot_load'
+        with metrics.phase('snapshot_load', group=group_id):
+            position = None if group_id in self.unbuilt else snapshot.load(path, models, database)
+        progress['phase'] = 'read'
+        with metrics.phase('read', group=group_id):
+            position = pipeline.run(database, models, position or pipeline.EMPTY_POSITION, workers=self.workers,
+                                    progress=progress, watch=slot.early)
+        progress['phase'] = 'snapshot_save'
+        with metrics.phase('snapshot_save', group=group_id):
+            snapshot.save(path, models, position, group_id,
+                          likes=database.recent_likes(config.get('like_sync_window', LIKE_WINDOW)))
+        self.unbuilt.discard(group_id)
+
+        size_report = generator.size_report()
+        print("Generator model for group {}: {}".format(group_id, ", ".join(
+            "{}={}".format(key, value) for key, value in size_report.items())))
+        for key, value in size_report.items():
+            metrics.model_size.set(value, group=group_id, model='generator', kind=key)
+
+        return self.build(config, analyzer, generator, database), size_report['bytes'] + analyzer.size_bytes()
@@ -0,0 +1,198 @@
+import random
+from array import array
+
+# marks the start of every message in a SuffixIndex; never an interned token id
+BOS = -1
+
+
+class _Segment:
+    # a suffix array over positions [start, end) of a SuffixIndex, plus a Fenwick tree over the positions'
+    # weights in suffix order, so a context's matches are one contiguous, weighted range
+    __slots__ = ('start', 'end', 'suffixes', 'tree')
+
+    def __init__(self, start, end, suffixes, weights):
+        self.start = start
+        self.end = end
+        self.suffixes = suffixes
+        # 1-based: tree[i] holds the weight of suffixes (i - lowbit(i), i], built in O(n)
+        self.tree = array('q', [0])
+        self.tree.extend(weights[position] for position in suffixes)
+        for i in range(1, len(self.tree)):
+            parent = i + (i & -i)
+            if parent < len(self.tree):
+                self.tree[parent] += self.tree[i]
+
+    def prefix(self, i):
+        total = 0
+        while i:
+            total += self.tree[i]
+            i -= i & -i
+        return total
+
+    def add(self, i, delta):
+        # adds delta to the weight of suffixes[i]
+        i += 1
+        while i < len(self.tree):
+            self.tree[i] += delta
+            i += i & -i
+
+    def find(self, total):
+        # the first suffix whose running weight exceeds total
+        position = 0
+        step = 1 << (len(self.suffixes).bit_length() - 1)
+        while step:
+            if position + step < len(self.tree) and self.tree[position + step] <= total:
+                position += step
+                total -= self.tree[position]
+            step >>= 1
+        return position
+
+
+class SuffixIndex:
+    # one user's messages as a single array of token ids, each message prefixed with BOS and weighted
+    # per position. Positions are indexed by suffix arrays sorted on their first k tokens (stopping at the
+    # end of their message), so the followers of any context of 1..k tokens are one range per segment,
+    # found by binary search and sampled by weight: every order shares the same 16-20 bytes per token.
+    # New messages go to an unsorted tail that's sorted into a segment on the next lookup; segments are
+    # merged like a binary counter, so each position is re-sorted O(log n) times
+    __slots__ = ('k', 'tokens', 'weights', 'segments')
+
+    def __init__(self, k):
+        self.k = k
+        self.tokens = array('i')
+        self.weights = array('i')
+        self.segments = []
+
+    def __len__(self):
+        return len(self.tokens)
+
+    @classmethod
+    def restore(cls, k, tokens, weights, suffixes=None):
+        # suffixes, when given, must have been sorted with the same token ids
+        index = cls(k)
+        index.tokens = tokens
+        index.weights = weights
+        if suffixes is not None and len(suffixes):
+            index.segments.append(_Segment(0, len(tokens), suffixes, weights))
+        return index
+
+    def add(self, ids, weight=1):
+        self.tokens.append(BOS)
+        self.tokens.extend(ids)
+        self.weights.extend([weight] * (len(ids) + 1))
+
+    def _key(self, position, length):
+        # the tokens from position on, cut at the end of their message
+        key = self.tokens[position:position + length]
+        if BOS in key[1:]:
+            key = key[:key[1:].index(BOS) + 1]
+        return key.tobytes()
+
+    def _seal(self):
+        sealed = self.segments[-1].end if self.segments else 0
+        if sealed == len(self.tokens):
+            return
+
+        self.segments.append(self._sort(sealed, len(self.tokens), range(sealed, len(self.tokens))))
+        while len(self.segments) > 1 and (self.segments[-1].end - self.segments[-1].start
+                                          >= self.segments[-2].end - self.segments[-2].start):
+            newer, older = self.segments.pop(), self.segments.pop()
+            # the two sorted runs merge in linear time
+            self.segments.append(self._sort(older.start, newer.end, list(older.suffixes) + list(newer.suffixes)))
+
+    def _sort(self, start, end, positions):
+        return _Segment(start, end, array('i', sorted(positions, key=lambda position: self._key(position, self.k))),
+                        self.weights)
+
+    def compact(self):
+        # sorts everything into a single segment
+        self._seal()
+        while len(self.segments) > 1:
+            newer, older = self.segments.pop(), self.segments.pop()
+            self.segments.append(self._sort(older.start, newer.end, list(older.suffixes) + list(newer.suffixes)))
+
+    def suffixes(self):
+        self.compact()
+        return self.segments[0].suffixes if self.segments else array('i')
+
+    def _range(self, segment, context):
+        # the suffixes starting with context, as [lo, hi)
+        suffixes = segment.suffixes
+        length = len(context) // 4
+        lo, hi = 0, len(suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(suffixes[mid], length) < context:
+                lo = mid + 1
+            else:
+                hi = mid
+        first, hi = lo, len(suffixes)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._key(suffixes[mid], length) <= context:
+                lo = mid + 1
+            else:
+                hi = mid
+        return first, lo
+
+    def sample(self, context, memo=None):
+        # a weighted draw from the tokens that follow context, or None if it never occurs; BOS means the
+        # message ended there. Passing the same memo dict to a run of draws skips repeated range searches
+        self._seal()
+        context = context.tobytes()
+        found = memo.get(context) if memo is not None else None
+        if found is None:
+            found = self._ranges(context)
+            if memo is not None:
+                memo[context] = found
+        ranges, total = found
+
+        if not total:
+            return None
+
+        draw = random.randrange(total)
+        for segment, below, weight in ranges:
+            if draw < weight:
+                follower = segment.suffixes[segment.find(below + draw)] + len(context) // 4
+                return self.tokens[follower] if follower < len(self.tokens) else BOS
+            draw -= weight
+
+    def reweight(self, ids, weight, new_weight):
+        # finds a message of exactly ids that was added with weight and gives it new_weight instead; False
+        # if there's none. Identical messages with the same weight are interchangeable, so any one will do
+        self._seal()
+        message = array('i', [BOS])
+        message.extend(ids)
+        context = message[:self.k].tobytes()
+        end = len(message)
+        for segment in self.segments:
+            lo, hi = self._range(segment, context)
+            for position in segment.suffixes[lo:hi]:
+                if (self.weights[position] == weight and self.tokens[position:position + end] == message
+                        and (position + end == len(self.tokens) or self.tokens[position + end] == BOS)):
+                    for offset in range(end):
+                        self._set_weight(position + offset, new_weight)
+                    return True
+        return False
+
+    def _set_weight(self, position, weight):
+        delta = weight - self.weights[position]
+        self.weights[position] = weight
+        for segment in self.segments:
+            if segment.start <= position < segment.end:
+                # the position's place in suffix order: among the suffixes sharing its key
+                lo, hi = self._range(segment, self._key(position, self.k))
+                segment.add(next(i for i in range(lo, hi) if segment.suffixes[i] == position), delta)
+                return
+
+    def _ranges(self, context):
+        ranges = []
+        total = 0
+        for segment in self.segments:
+            lo, hi = self._range(segment, context)
+            if lo < hi:
+                below = segment.prefix(lo)
+                weight = segment.prefix(hi) - below
+                ranges.append((segment, below, weight))
+                total += weight
+        return ranges, total
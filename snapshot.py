@@ -0,0 +1,111 @@
+import json
+import mmap
+import os
+import struct
+from array import array
+
+from groupme import GroupMe
+from tokenizer import tokenize
+
+# file layout: header struct, JSON header, then 8-byte aligned raw arrays that load
+# straight out of a read-only mmap
+MAGIC = b"GMSNAP\x00\x00"
+VERSION = 6
+HEADER = struct.Struct("<8sII")
+ALIGNMENT = 8
+
+
+def _aligned(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save(path, models, position, group_id, likes=None):
+    # likes (message_id -> favorited_by, for the most recent messages the models read) lets load catch the
+    # models up on likes that change after the snapshot is taken
+    header = {'group_id': group_id, 'position': position, 'likes': likes or {}, 'models': {}}
+    sections = []
+    offset = 0
+
+    for name, model in models.items():
+        meta, arrays = model.to_snapshot()
+        layout = {}
+        for array_name, data in arrays.items():
+            layout[array_name] = [data.typecode, offset, len(data)]
+            sections.append((offset, data))
+            offset = _aligned(offset + len(data) * data.itemsize)
+        header['models'][name] = {'config': model.snapshot_config(), 'meta': meta, 'arrays': layout}
+
+    encoded = json.dumps(header).encode('utf-8')
+    base = _aligned(HEADER.size + len(encoded))
+
+    # write beside the old snapshot and swap, so a crash never leaves a torn file
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(encoded)))
+        f.write(encoded)
+        for start, data in sections:
+            f.seek(base + start)
+            data.tofile(f)
+    os.replace(temporary, path)
+
+
+def load(path, models, database: GroupMe):
+    # returns the snapshot's position, or None if it can't be used and the models need a full rebuild;
+    # models are only touched once the snapshot has been checked against the database
+    if not os.path.exists(path):
+        print("No model snapshot at {}.".format(path))
+        return None
+
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        magic, version, length = HEADER.unpack_from(buffer)
+        if magic != MAGIC or version != VERSION:
+            print("Ignoring model snapshot with unsupported format version {}.".format(version))
+            return None
+
+        header = json.loads(buffer[HEADER.size:HEADER.size + length].decode('utf-8'))
+        base = _aligned(HEADER.size + length)
+
+        if header['group_id'] != database.gid:
+            print("Ignoring model snapshot for group {}.".format(header['group_id']))
+            return None
+
+        stored = header['models']
+        for name, model in models.items():
+            if name not in stored or stored[name]['config'] != model.snapshot_config():
+                print("Ignoring model snapshot built with different {} settings.".format(name))
+                return None
+
+        position = header['position']
+        if not consistent(database, position):
+            print("Model snapshot does not match the database.")
+            return None
+
+        view = memoryview(buffer)
+        try:
+            for name, model in models.items():
+                arrays = {}
+                for array_name, (typecode, offset, count) in stored[name]['arrays'].items():
+                    start = base + offset
+                    arrays[array_name] = view[start:start + count * array(typecode).itemsize].cast(typecode)
+                model.load_snapshot(stored[name]['meta'], arrays)
+                for data in arrays.values():
+                    data.release()
+        finally:
+            view.release()
+
+    likes = header['likes']
+    for message in database.changed_likes(likes):
+        tokens = tokenize(message['text'])
+        for model in models.values():
+            model.update_likes(message, likes[message['id']], tokens)
+
+    return position
+
+
+def consistent(database: GroupMe, position):
+    # everything before the snapshot's last timestamp must still be in the database, and nothing more;
+    # messages sharing that timestamp are matched by id, since more may have arrived in the same second
+    if position['timestamp'] is None:
+        return True
+    return (database.count_messages(before=position['timestamp']) == position['count'] - len(position['message_ids'])
+            and all(database.has_message(message_id) for message_id in position['message_ids']))
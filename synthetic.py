@@ -0,0 +1,82 @@
+import itertools
+import math
+import random
+
+# Zipf exponents: word frequency by rank, and how unevenly users post and like
+WORD_SKEW = 1.1
+USER_SKEW = 1.2
+
+# words per message are lognormal, roughly median 7 with a long tail, capped like GroupMe's 1000 characters
+MEDIAN_WORDS = 7
+WORD_SPREAD = 0.9
+MAX_WORDS = 150
+
+# likes per message are geometric with this mean; most messages get none
+MEAN_LIKES = 0.8
+
+
+def _zipf(n, skew):
+    # cumulative weights for random.choices: rank r gets weight 1 / r^skew
+    return list(itertools.accumulate(1.0 / (rank ** skew) for rank in range(1, n + 1)))
+
+
+def _word(i):
+    # short, pronounceable and unique: words are drawn by rank, so frequent ones come out short
+    letters = "etaoinshrdlucmfwypvbgkjqxz"
+    word = ""
+    while True:
+        word += letters[i % 26]
+        i //= 26
+        if not i:
+            return word
+
+
+class SyntheticGroup:
+    # a seeded, reproducible group with Zipfian vocabulary, skewed per-user activity and likes; messages are
+    # generated lazily, so it scales to millions of messages without holding them
+    def __init__(self, count, users=50, vocabulary=20000, seed=0, group_id='1', start=1500000000):
+        self.count = count
+        self.seed = seed
+        self.group_id = group_id
+        self.start = start
+
+        rnd = random.Random(seed)
+        self.members = [{'user_id': str(100 + i), 'nickname': 'user{}'.format(i), 'name': 'User {}'.format(i)}
+                        for i in range(users)]
+        self.words = [_word(i) for i in range(vocabulary)]
+        self.word_weights = _zipf(vocabulary, WORD_SKEW)
+
+        # who posts and who likes are skewed independently, so the chattiest user isn't also the keenest liker
+        self.senders = rnd.sample(self.members, users)
+        self.sender_weights = _zipf(users, USER_SKEW)
+        self.likers = rnd.sample(self.members, users)
+        self.liker_weights = _zipf(users, USER_SKEW)
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        # oldest first, a message every minute or so
+        rnd = random.Random(self.seed + 1)
+        timestamp = self.start
+        stop = 1.0 / (1.0 + MEAN_LIKES)
+        for i in range(self.count):
+            sender = rnd.choices(self.senders, cum_weights=self.sender_weights)[0]
+            length = min(MAX_WORDS, max(1, int(rnd.lognormvariate(math.log(MEDIAN_WORDS), WORD_SPREAD))))
+
+            likers = set()
+            while rnd.random() > stop and len(likers) < len(self.members):
+                likers.add(rnd.choices(self.likers, cum_weights=self.liker_weights)[0]['user_id'])
+
+            timestamp += rnd.randint(1, 120)
+            yield {
+                'id': str(10 ** 17 + i),
+                'group_id': self.group_id,
+                'user_id': sender['user_id'],
+                'name': sender['name'],
+                'sender_type': 'user',
+                'system': False,
+                'created_at': timestamp,
+                'text': " ".join(rnd.choices(self.words, cum_weights=self.word_weights, k=length)),
+                'favorited_by': sorted(likers),
+            }
@@ -0,0 +1,88 @@
+import random
+
+import pipeline
+from analyzer import Analyzer
+from bot import GroupBot
+from fakegroupme import FakeGroupMe, sample_group, serve
+from gen import Generator
+from groupme import GroupMe, connect
+from likesync import LikeSync
+from timeline import LIKES_RECEIVED, LIKES_SENT, MESSAGES
+
+K = 3
+WINDOW = 100
+
+
+class _Groups:
+    # the one thing LikeSync asks of a GroupRegistry
+    def __init__(self, bot):
+        self.bot = bot
+
+    def bots(self):
+        return [(self.bot.database.gid, self.bot)]
+
+
+def _models(database):
+    analyzer, generator = Analyzer(database), Generator(K, database)
+    pipeline.run(database, {'analyzer': analyzer, 'generator': generator})
+    return analyzer, generator
+
+
+def _analyzer_state(analyzer):
+    return {
+        'messages': dict(analyzer.message_counts),
+        'sent': analyzer.get_most_overall_likes_sent(limit=1000),
+        'received': analyzer.get_most_overall_likes_recd(limit=1000),
+        'ratios': analyzer.get_highest_overall_ratio(limit=1000),
+        'self_likes': analyzer.get_self_likes(limit=1000),
+        'timeline': {series: analyzer.timeline.totals(series) for series in (MESSAGES, LIKES_SENT, LIKES_RECEIVED)},
+    }
+
+
+def _generator_state(generator):
+    # each user's tokens with their weights; which of two identical messages got reweighted doesn't matter
+    return {uid: sorted(zip(index.tokens, index.weights)) for uid, index in generator.m.items()}
+
+
+def test_synced_likes_match_a_rebuild(tmp_path):
+    members, messages = sample_group(count=300)
+    app = FakeGroupMe('1', members, messages)
+    server = serve(app)
+    try:
+        config = {
+            'api_url': 'http://127.0.0.1:{}/v3'.format(server.server_port),
+            'auth_key': 'test',
+            'group_id': '1',
+            'bot_id': 'test',
+            'like_sync_window': WINDOW,
+            'mimic_pool_size': 0,
+        }
+        database = GroupMe(connect('sqlite:///{}'.format(tmp_path / 'test.db')), config)
+        database.recreate_messages()
+        database.recreate_all_names()
+        analyzer, generator = _models(database)
+        bot = GroupBot(config, analyzer, generator, database, send=lambda bot_id, text: None)
+
+        # likes and unlikes on recent messages, including self-likes and a message losing all its likes
+        rnd = random.Random(0)
+        for message in messages[-WINDOW:]:
+            for member in rnd.sample(members, 2):
+                app.like(message['id'], member['user_id'])
+            app.like(message['id'], message['user_id'])
+        for message in messages[-WINDOW:-WINDOW // 2]:
+            for liker in list(message['favorited_by']):
+                app.unlike(message['id'], liker)
+        # and one outside the window, which isn't synced
+        app.like(messages[0]['id'], members[0]['user_id'])
+
+        assert LikeSync(_Groups(bot)).run_once() > 0
+        # nothing left to change
+        assert LikeSync(_Groups(bot)).run_once() == 0
+
+        rebuilt_analyzer, rebuilt_generator = _models(database)
+        assert _analyzer_state(analyzer) == _analyzer_state(rebuilt_analyzer)
+        assert _generator_state(generator) == _generator_state(rebuilt_generator)
+        assert database.recent_likes(WINDOW) == {message['id']: message['favorited_by']
+                                                 for message in messages[-WINDOW:]}
+    finally:
+        server.shutdown()
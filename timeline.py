@@ -0,0 +1,210 @@
+import datetime
+import heapq
+from array import array
+from bisect import bisect_right
+from operator import itemgetter
+
+from ranking import SpaceSaving, Tally
+
+DAY = 86400
+
+# days kept at daily resolution, at least, counted back from the newest message; older days roll up into
+# months a whole month at a time, so rolling up (which rewrites every user's prefix sums) runs once a month
+DAYS = 62
+
+# per-user series
+MESSAGES = 'messages'
+LIKES_SENT = 'likes_sent'
+LIKES_RECEIVED = 'likes_received'
+
+_EPOCH = datetime.date(1970, 1, 1)
+
+
+def day_of(timestamp):
+    return int(timestamp) // DAY
+
+
+def parse_day(text):
+    # YYYY-MM-DD -> day number
+    return (datetime.datetime.strptime(text, "%Y-%m-%d").date() - _EPOCH).days
+
+
+def format_day(day):
+    return (_EPOCH + datetime.timedelta(days=day)).isoformat()
+
+
+def _month_of(day):
+    date = _EPOCH + datetime.timedelta(days=day)
+    return (date.replace(day=1) - _EPOCH).days
+
+
+class Timeline:
+    # per-user message and like counts, and word counts, in time buckets: one per day for at least the last
+    # DAYS days, one per calendar month before that. Each user's series is stored as prefix sums over the
+    # buckets, so the total over any run of buckets is one subtraction
+    def __init__(self, word_capacity=None):
+        self.word_capacity = word_capacity
+        # start day of each bucket, ascending; a bucket runs until the next one starts
+        self.keys = []
+        # series -> user_id -> prefix sums: [0, bucket 0, bucket 0 + 1, ...], possibly stopping early
+        # when the user has had nothing since
+        self.series = {MESSAGES: {}, LIKES_SENT: {}, LIKES_RECEIVED: {}}
+        # word -> count, per bucket
+        self.words = []
+        # days before this are rolled up into months
+        self.cutoff = None
+
+    def _new_words(self):
+        return Tally() if self.word_capacity is None else SpaceSaving(self.word_capacity)
+
+    def _bucket(self, day):
+        # index of the bucket day belongs in, adding it if it isn't there yet
+        key = _month_of(day) if self.cutoff is not None and day < self.cutoff else day
+        i = bisect_right(self.keys, key) - 1
+        if i >= 0 and self.keys[i] == key:
+            return i
+
+        i += 1
+        self.keys.insert(i, key)
+        self.words.insert(i, self._new_words())
+        for prefixes in self.series.values():
+            for sums in prefixes.values():
+                if len(sums) > i + 1:
+                    sums.insert(i + 1, sums[i])
+
+        cutoff = _month_of(self.keys[-1] - DAYS)
+        if self.cutoff is None or cutoff > self.cutoff:
+            self.roll_up(cutoff)
+            return self._bucket(day)
+        return i
+
+    def add(self, timestamp, series, uid, count=1):
+        self._add(self._bucket(day_of(timestamp)), series, uid, count)
+
+    def _add(self, i, series, uid, count):
+        sums = self.series[series].get(uid)
+        if sums is None:
+            sums = self.series[series][uid] = array('q', [0])
+        while len(sums) < i + 2:
+            sums.append(sums[-1])
+        for j in range(i + 1, len(sums)):
+            sums[j] += count
+
+    def add_words(self, timestamp, words, count=1):
+        bucket = self.words[self._bucket(day_of(timestamp))]
+        for word in words:
+            bucket.add(word, count)
+
+    def roll_up(self, cutoff):
+        # merges every bucket before cutoff into its calendar month
+        if self.cutoff is not None and cutoff <= self.cutoff:
+            return
+        self.cutoff = cutoff
+
+        keys = []
+        words = []
+        # for each merged bucket, the index of the first original bucket in it
+        firsts = []
+        for i, key in enumerate(self.keys):
+            if key < cutoff:
+                key = _month_of(key)
+            if keys and keys[-1] == key:
+                for word, count in self.words[i].items():
+                    words[-1].add(word, count)
+                continue
+            keys.append(key)
+            words.append(self.words[i])
+            firsts.append(i)
+
+        if len(keys) == len(self.keys):
+            return
+
+        bounds = firsts[1:] + [len(self.keys)]
+        # one getter per length of prefix sums, since they can stop early
+        getters = {}
+        for prefixes in self.series.values():
+            for uid, sums in prefixes.items():
+                getter = getters.get(len(sums))
+                if getter is None:
+                    getter = getters[len(sums)] = itemgetter(0, *[min(bound, len(sums) - 1) for bound in bounds])
+                prefixes[uid] = array('q', getter(sums))
+        self.keys, self.words = keys, words
+
+    def _first(self, since):
+        # the first bucket on or after since; a rolled-up month that since falls inside counts whole
+        if since is None:
+            return 0
+        i = bisect_right(self.keys, since) - 1
+        if i >= 0 and self.keys[i] < since and not (self.keys[i] < self.cutoff and _month_of(since) == self.keys[i]):
+            i += 1
+        return max(0, i)
+
+    def start(self, since):
+        # the first day actually counted from since: since, or the start of the rolled-up month it falls in
+        i = self._first(since)
+        return self.keys[i] if i < len(self.keys) and self.keys[i] < since else since
+
+    def total(self, series, uid, since=None):
+        sums = self.series[series].get(uid)
+        if sums is None:
+            return 0
+        first = self._first(since)
+        return sums[-1] - sums[min(first, len(sums) - 1)]
+
+    def totals(self, series, since=None):
+        first = self._first(since)
+        return {uid: sums[-1] - sums[min(first, len(sums) - 1)] for uid, sums in self.series[series].items()
+                if sums[-1] - sums[min(first, len(sums) - 1)]}
+
+    def ratios(self, since=None):
+        # likes received / messages sent, for users liked in the range
+        messages = self.totals(MESSAGES, since)
+        return {uid: float(received) / messages[uid]
+                for uid, received in self.totals(LIKES_RECEIVED, since).items() if messages.get(uid)}
+
+    def top_words(self, since=None, limit=15):
+        words = Tally()
+        for bucket in self.words[self._first(since):]:
+            for word, count in bucket.items():
+                words.add(word, count)
+        return words.top(limit)
+
+    def to_snapshot(self):
+        # per-bucket counts rather than prefix sums, so shards with different buckets can be merged
+        return {
+            'keys': self.keys,
+            'cutoff': self.cutoff,
+            'series': {series: {uid: _counts(sums) for uid, sums in prefixes.items()}
+                       for series, prefixes in self.series.items()},
+            'words': [dict(bucket.items()) for bucket in self.words],
+        }
+
+    def load_snapshot(self, meta):
+        if meta['cutoff'] is not None:
+            self.roll_up(meta['cutoff'])
+        for series, counts in meta['series'].items():
+            for uid, entries in counts.items():
+                for i, count in entries:
+                    self._add(self._bucket(meta['keys'][i]), series, uid, count)
+        for key, words in zip(meta['keys'], meta['words']):
+            bucket = self.words[self._bucket(key)]
+            for word, count in words.items():
+                bucket.add(word, count)
+
+
+def _counts(sums):
+    # [bucket, count] for each bucket a prefix sum grows in
+    return [[i, sums[i + 1] - sums[i]] for i in range(len(sums) - 1) if sums[i + 1] != sums[i]]
+
+
+def top(values, limit=15):
+    # values from Timeline.totals or ratios, in RankIndex order: highest first, ties by key
+    return heapq.nsmallest(limit, values.items(), key=lambda item: (-item[1], item[0]))
+
+
+def rank(values, uid):
+    # as RankIndex.rank: 1 for the highest value, -1 if uid has nothing in the range
+    if uid not in values:
+        return -1
+    value = values[uid]
+    return 1 + sum(1 for key, other in values.items() if other > value or (other == value and key < uid))
@@ -0,0 +1,46 @@
+from collections import namedtuple
+
+IGNORE = ['the', 'be', 'to', 'of', 'and', 'a', 'in', 'that', 'have', 'I', 'it',
+          'for', 'not', 'on', 'with', 'he', 'as', 'you', 'do', 'at', 'this', 'but',
+          'his', 'by', 'from', 'they', 'we', 'say', 'her', 'she', 'or', 'an', 'will',
+          'my', 'one', 'all', 'would', 'there', 'their', 'what', 'so', 'up', 'out',
+          'if', 'about', 'who', 'get', 'which', 'go', 'me', 'when', 'make', 'can',
+          'like', 'time', 'no', 'just', 'him', 'know', 'take', 'person', 'into',
+          'year', 'your', 'good', 'some', 'could', 'them', 'see', 'other', 'than',
+          'then', 'now', 'look', 'only', 'come', 'its', 'over', 'think', 'also',
+          'back', 'after', 'use', 'two', 'how', 'our', 'work', 'first', 'well', 'way',
+          'even', 'new', 'want', 'because', 'any', 'these', 'give', 'day', 'most',
+          'us', '']
+
+# words are compared lowercased, so the stopwords are too
+STOPWORDS = frozenset(word.lower() for word in IGNORE)
+
+NOT_LETTERS_OR_DIGITS = '!"#%\'()*+,-./:;<=>?@[\\]^_`{|}~'
+STRIP_TABLE = str.maketrans('', '', NOT_LETTERS_OR_DIGITS)
+
+# joins a batch of texts so they can be normalized in one pass
+SEPARATOR = '\x00'
+
+# raw: whitespace-separated tokens as written, which the generator chains together
+# words: raw with punctuation stripped, lowercased and stopwords dropped, which the analyzer counts
+Tokens = namedtuple('Tokens', ['raw', 'words'])
+
+
+def _words(normalized):
+    return [word for word in normalized.split() if word not in STOPWORDS]
+
+
+def tokenize(text):
+    return Tokens(text.split(), _words(text.translate(STRIP_TABLE).lower()))
+
+
+def tokenize_all(texts):
+    # tokenize a batch of texts, stripping and lowercasing them all in one pass
+    texts = list(texts)
+    joined = SEPARATOR.join(texts)
+    if joined.count(SEPARATOR) != max(len(texts) - 1, 0):
+        # a text contains the separator itself
+        return [tokenize(text) for text in texts]
+
+    normalized = joined.translate(STRIP_TABLE).lower().split(SEPARATOR) if texts else []
+    return [Tokens(text.split(), _words(words)) for text, words in zip(texts, normalized)]
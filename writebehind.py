@@ -0,0 +1,126 @@
+import threading
+import time
+from collections import deque
+
+from groupme import insert_rows
+
+# rows waiting that start a write, and seconds a row may wait for one
+BATCH_SIZE = 500
+INTERVAL = 1.0
+
+# seconds of flushes the flush rate is averaged over
+RATE_WINDOW = 60
+
+
+class WriteBehind:
+    # stores received messages from a background thread, so a callback never waits on a commit: rows are
+    # queued as they arrive (and read into the models right away) and written in one transaction once
+    # batch_size of them are waiting or the oldest has waited interval seconds. close() writes whatever is
+    # left, and rows that fail to write are kept for the next try
+    def __init__(self, db, batch_size=BATCH_SIZE, interval=INTERVAL):
+        self.db = db
+        self.batch_size = batch_size
+        self.interval = interval
+
+        self.lock = threading.Condition()
+        # message_id -> row, waiting and being written
+        self.pending = {}
+        self.flushing = {}
+        self.oldest = None
+        self.closed = False
+        # held while writing, so flushes from close() or a group load don't overlap the thread's
+        self.flush_lock = threading.Lock()
+
+        self.flushes = 0
+        self.flushed = 0
+        self.failures = 0
+        # (time, rows) per recent flush
+        self.recent = deque()
+
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def add(self, row, is_stored):
+        # queues a Message row; False if it's queued or stored already (asking is_stored(message_id) last),
+        # True otherwise
+        message_id = row['message_id']
+        with self.lock:
+            if message_id in self.pending or message_id in self.flushing:
+                return False
+        if is_stored(message_id):
+            return False
+
+        with self.lock:
+            if message_id in self.pending or message_id in self.flushing:
+                return False
+            self.pending[message_id] = row
+            if self.oldest is None:
+                # the thread starts timing this batch
+                self.oldest = time.time()
+                self.lock.notify()
+            elif len(self.pending) >= self.batch_size:
+                self.lock.notify()
+        return True
+
+    def flush(self):
+        # writes everything queued so far; returns how many rows were written
+        with self.flush_lock:
+            with self.lock:
+                self.flushing, self.pending, self.oldest = self.pending, {}, None
+            if not self.flushing:
+                return 0
+
+            try:
+                insert_rows(self.db, self.flushing)
+            except Exception as e:
+                print("Failed to store {} messages: {}".format(len(self.flushing), e))
+                with self.lock:
+                    self.failures += 1
+                    self.pending.update(self.flushing)
+                    self.flushing = {}
+                    self.oldest = time.time()
+                return 0
+
+            now = time.time()
+            with self.lock:
+                count = len(self.flushing)
+                self.flushing = {}
+                self.flushes += 1
+                self.flushed += count
+                self.recent.append((now, count))
+                while self.recent[0][0] < now - RATE_WINDOW:
+                    self.recent.popleft()
+            return count
+
+    def close(self):
+        # stops the thread and writes what's left, so nothing received is lost on shutdown
+        with self.lock:
+            self.closed = True
+            self.lock.notify()
+        self.thread.join()
+        self.flush()
+
+    def _run(self):
+        while True:
+            with self.lock:
+                while not self.closed and not self._due():
+                    timeout = None if self.oldest is None else max(0.0, self.oldest + self.interval - time.time())
+                    self.lock.wait(timeout)
+                if self.closed:
+                    return
+            self.flush()
+
+    def _due(self):
+        return len(self.pending) >= self.batch_size or (
+            self.oldest is not None and time.time() >= self.oldest + self.interval)
+
+    def stats(self):
+        with self.lock:
+            now = time.time()
+            return {
+                'pending': len(self.pending) + len(self.flushing),
+                'flushes': self.flushes,
+                'flushed': self.flushed,
+                'failures': self.failures,
+                'rate': sum(count for when, count in self.recent if when >= now - RATE_WINDOW) / RATE_WINDOW,
+            }